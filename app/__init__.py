@@ -18,27 +18,102 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 3600  # 1 hour
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = 604800
-  
+    app.config['REVOCATION_CACHE_SIZE'] = int(os.getenv('REVOCATION_CACHE_SIZE', 10000))
+    app.config['REVOCATION_CACHE_TTL'] = int(os.getenv('REVOCATION_CACHE_TTL', 30))  # seconds
+    app.config['REVOCATION_BLOOM_ENABLED'] = os.getenv('REVOCATION_BLOOM_ENABLED', 'false').lower() == 'true'
+    app.config['REVOCATION_BLOOM_CAPACITY'] = int(os.getenv('REVOCATION_BLOOM_CAPACITY', 100000))
+    app.config['REVOCATION_BLOOM_FP_RATE'] = float(os.getenv('REVOCATION_BLOOM_FP_RATE', 0.01))
+    app.config['REVOCATION_BLOOM_REBUILD_INTERVAL'] = int(os.getenv('REVOCATION_BLOOM_REBUILD_INTERVAL', 3600))  # seconds, 0 = off
+    app.config['REVOCATION_SHM_ENABLED'] = os.getenv('REVOCATION_SHM_ENABLED', 'false').lower() == 'true'
+    app.config['REVOCATION_SHM_NAME'] = os.getenv('REVOCATION_SHM_NAME', 'jwt_auth_revoked')
+    app.config['REVOCATION_SHM_SLOTS'] = int(os.getenv('REVOCATION_SHM_SLOTS', 262144))
+    app.config['JWT_PROFILE_CLAIMS'] = os.getenv('JWT_PROFILE_CLAIMS', 'false').lower() == 'true'
+    app.config['TOKEN_VERSION_REVOCATION'] = os.getenv('TOKEN_VERSION_REVOCATION', 'false').lower() == 'true'
+    app.config['TOKEN_PURGE_INTERVAL'] = int(os.getenv('TOKEN_PURGE_INTERVAL', 0))  # seconds, 0 = off
+    app.config['TOKEN_PURGE_BATCH_SIZE'] = int(os.getenv('TOKEN_PURGE_BATCH_SIZE', 500))
+    app.config['TOKEN_PURGE_PAUSE'] = float(os.getenv('TOKEN_PURGE_PAUSE', 0.1))  # seconds between batches
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))  # seconds
+    app.config['USER_CACHE_MAX_BYTES'] = int(os.getenv('USER_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    app.config['PASSWORD_HASH_POOL'] = os.getenv('PASSWORD_HASH_POOL', 'thread')  # thread or process
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    app.config['PASSWORD_HASH_QUEUE_LIMIT'] = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 32))
+    app.config['PASSWORD_HASH_RETRY_AFTER'] = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))  # seconds
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+    app.config['IMPORT_HASH_WORKERS'] = int(os.getenv('IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+    app.config['RESET_RESEND_WINDOW'] = int(os.getenv('RESET_RESEND_WINDOW', 60))  # seconds between reset emails per user
+    app.config['RESET_URL'] = os.getenv('RESET_URL', 'http://localhost:5000/reset-password/')
+    app.config['MAIL_FROM'] = os.getenv('MAIL_FROM', 'no-reply@flaskapp.com')
+    app.config['SMTP_HOST'] = os.getenv('SMTP_HOST', '')  # empty = log emails instead of sending
+    app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', 25))
+    app.config['SMTP_USERNAME'] = os.getenv('SMTP_USERNAME', '')
+    app.config['SMTP_PASSWORD'] = os.getenv('SMTP_PASSWORD', '')
+    app.config['SMTP_STARTTLS'] = os.getenv('SMTP_STARTTLS', 'false').lower() == 'true'
+    app.config['SMTP_TIMEOUT'] = float(os.getenv('SMTP_TIMEOUT', 10))  # seconds
+    app.config['SMTP_POOL_SIZE'] = int(os.getenv('SMTP_POOL_SIZE', 2))
+    app.config['SMTP_NOOP_AFTER'] = float(os.getenv('SMTP_NOOP_AFTER', 5))  # idle seconds before a NOOP check
+    app.config['SMTP_MAX_IDLE'] = float(os.getenv('SMTP_MAX_IDLE', 60))  # idle seconds before a session is closed
+    app.config['EMAIL_OUTBOX_BATCH_SIZE'] = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 100))
+    app.config['EMAIL_OUTBOX_POLL_INTERVAL'] = float(os.getenv('EMAIL_OUTBOX_POLL_INTERVAL', 1.0))  # seconds
+    app.config['EMAIL_MAX_ATTEMPTS'] = int(os.getenv('EMAIL_MAX_ATTEMPTS', 8))
+    app.config['PG_NOTIFY_ENABLED'] = (
+        os.getenv('PG_NOTIFY_ENABLED', 'true').lower() == 'true'
+        and (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('postgresql')
+    )
 
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
 
+    # Bounded pool for password hashing
+    from .hashing import init_hasher
+    init_hasher(app)
+
+    # Pooled SMTP sessions for the email worker; connects lazily
+    from .mailer import init_mailer
+    init_mailer(app)
+
     # Import and register routes
     from .routes import init_routes
     init_routes(app)
 
+    # Register CLI commands
+    from .commands import init_commands
+    init_commands(app)
+
     # Create database tables
     with app.app_context():
         db.create_all()
 
+    # Postgres LISTEN connection shared by everything that reacts to other workers' writes
+    if app.config['PG_NOTIFY_ENABLED']:
+        from .notify import init_listener
+        with app.app_context():
+            init_listener(app)
+
+    # Revocation cache, Bloom filter and shared-memory table
+    from .revocation import init_revocation
+    revocation = init_revocation(app)
+
+    # Read-through cache of user profiles
+    from .users import init_user_cache
+    init_user_cache(app)
+
+    if 'pg_listener' in app.extensions:
+        app.extensions['pg_listener'].start()
+
+    # Optional background purge of expired tokens
+    from .maintenance import init_janitor
+    init_janitor(app)
+
     # JWT blacklist check
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
-        jti = jwt_payload['jti']
-        token = RevokedToken.query.filter_by(jti=jti).first()
-        return token is not None
+        if revocation.is_revoked(jwt_payload['jti'], jwt_payload.get('exp')):
+            return True
+        versions = app.extensions.get('token_versions')
+        return versions is not None and versions.is_outdated(jwt_payload['sub'], jwt_payload.get('ver'))
 
     return app
-
-from .models import RevokedToken  # Import here to avoid circular imports
\ No newline at end of file
@@ -0,0 +1,63 @@
+import hashlib
+import math
+import threading
+
+
+class CountingBloomFilter:
+    """Bloom filter with 8-bit counters instead of bits, so items can be removed again.
+
+    ``might_contain`` returning ``False`` is definite; ``True`` means "maybe" with a
+    false-positive rate close to ``fp_rate`` while at most ``capacity`` items are stored.
+    """
+
+    def __init__(self, capacity=100000, fp_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.fp_rate = fp_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.count = 0
+        self._counters = bytearray(self.size)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        with self._lock:
+            for pos in self._positions(item):
+                if self._counters[pos] < 255:
+                    self._counters[pos] += 1
+            self.count += 1
+
+    def remove(self, item):
+        with self._lock:
+            positions = self._positions(item)
+            if not all(self._counters[pos] for pos in positions):
+                return False
+            for pos in positions:
+                # A saturated counter has lost track of its true count, so it stays put
+                if self._counters[pos] < 255:
+                    self._counters[pos] -= 1
+            self.count -= 1
+            return True
+
+    def might_contain(self, item):
+        counters = self._counters
+        return all(counters[pos] for pos in self._positions(item))
+
+    def estimated_fp_rate(self):
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'items': self.count,
+            'size': self.size,
+            'hash_count': self.hash_count,
+            'memory_bytes': len(self._counters),
+            'target_fp_rate': self.fp_rate,
+            'estimated_fp_rate': round(self.estimated_fp_rate(), 6),
+        }
@@ -0,0 +1,244 @@
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from . import db
+from .hashing import generate_hash, is_supported_hash
+from .models import User
+from .utils import normalize_email
+
+MAX_REPORTED_ERRORS = 1000
+NAME_MAX = User.__table__.c.name.type.length
+EMAIL_MAX = User.__table__.c.email.type.length
+PASSWORD_MAX = User.__table__.c.password.type.length
+
+
+def parse_rows(lines, fmt):
+    """Yield ``(line_no, row, error)`` for each record of a CSV (with header) or NDJSON stream.
+
+    A record the CSV reader rejects is reported on its line and skipped. Input that is not
+    UTF-8 ends the stream with an error on the line being read when decoding failed; the bad
+    bytes are at or after it, and nothing past them can be read reliably.
+    """
+    line_no = 1 if fmt == 'csv' else 0
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(lines)
+            while True:
+                line_no += 1
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    yield line_no, None, f'Invalid CSV: {str(e)}'
+                    continue
+                yield line_no, row, None
+        lines = iter(lines)
+        while True:
+            line_no += 1
+            line = next(lines, None)
+            if line is None:
+                return
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f'Invalid JSON: {str(e)}'
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, 'Expected a JSON object'
+                continue
+            yield line_no, row, None
+    except UnicodeDecodeError as e:
+        yield line_no, None, f'Invalid UTF-8 ({e.reason}) at or after this line; the rest of the input was not read'
+
+
+def _hash_row(password, method):
+    # Runs in a worker process; a failure is returned rather than raised so it stays per row
+    try:
+        return generate_hash(password, method), None
+    except Exception as e:
+        return None, f'Hashing failed: {str(e)}'
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class UserImporter:
+    """Loads users in chunks: validate, hash across processes, COPY into a staging table,
+    then one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` into ``users``.
+
+    Bad rows and emails that already exist are reported per line and never abort the batch.
+    With ``prehashed`` the ``password_hash`` field is stored as-is instead of hashing ``password``.
+    """
+
+    def __init__(self, method, prehashed=False, chunk_size=5000, workers=None):
+        self.method = method
+        self.prehashed = prehashed
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.imported = 0
+        self.errors = []
+        self.error_count = 0
+
+    def _error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': message})
+
+    def _validate(self, chunk):
+        valid = []
+        seen = set()
+        for line_no, row, error in chunk:
+            if error:
+                self._error(line_no, error)
+                continue
+            name, email = row.get('name'), row.get('email')
+            secret = row.get('password_hash') if self.prehashed else row.get('password')
+            if not name or not email or not secret:
+                self._error(line_no, 'Missing required fields')
+                continue
+            if not all(isinstance(value, str) for value in (name, email, secret)):
+                self._error(line_no, 'Fields must be strings')
+                continue
+            email = normalize_email(email)
+            if len(name) > NAME_MAX:
+                self._error(line_no, f'Name longer than {NAME_MAX} characters')
+            elif len(email) > EMAIL_MAX:
+                self._error(line_no, f'Email longer than {EMAIL_MAX} characters')
+            elif self.prehashed and (not is_supported_hash(secret) or len(secret) > PASSWORD_MAX):
+                self._error(line_no, 'Unsupported password hash; expected pbkdf2, scrypt or argon2id')
+            elif email in seen:
+                self._error(line_no, 'Duplicate email in import')
+            else:
+                seen.add(email)
+                valid.append((line_no, name, email, secret))
+        return valid
+
+    def _load(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.execute(
+            'CREATE TEMP TABLE users_import (line INTEGER, name TEXT, email TEXT, password TEXT) ON COMMIT DROP'
+        )
+        cursor.copy_expert('COPY users_import (line, name, email, password) FROM STDIN WITH (FORMAT csv)', buf)
+        cursor.execute(
+            'INSERT INTO users (name, email, password, created_at) '
+            'SELECT name, email, password, now() at time zone \'utc\' FROM users_import '
+            'ON CONFLICT (lower(email)) DO NOTHING RETURNING email'
+        )
+        inserted = {email for (email,) in cursor.fetchall()}
+        db.session.commit()
+        for line_no, _, email, _ in rows:
+            if email not in inserted:
+                self._error(line_no, 'User already exists')
+        self.imported += len(inserted)
+
+    def _hash(self, executor, rows):
+        chunksize = max(1, len(rows) // (self.workers * 4))
+        results = executor.map(_hash_row, [r[3] for r in rows], repeat(self.method), chunksize=chunksize)
+        hashed = []
+        for (line_no, name, email, _), (pwhash, error) in zip(rows, results):
+            if error:
+                self._error(line_no, error)
+            else:
+                hashed.append((line_no, name, email, pwhash))
+        return hashed
+
+    def run(self, lines, fmt):
+        start = time.perf_counter()
+        executor = None if self.prehashed else ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            for chunk in _chunks(parse_rows(lines, fmt), self.chunk_size):
+                rows = self._validate(chunk)
+                if executor is not None and rows:
+                    rows = self._hash(executor, rows)
+                if not rows:
+                    continue
+                try:
+                    self._load(rows)
+                except Exception as e:
+                    db.session.rollback()
+                    for line_no, *_ in rows:
+                        self._error(line_no, f'Chunk failed: {str(e)}')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, seconds):
+        return {
+            'imported': self.imported,
+            'failed': self.error_count,
+            'errors': self.errors,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(self.imported / seconds, 1) if seconds else 0.0,
+        }
+
+
+EXPORT_COLUMNS = ('id', 'name', 'email', 'created_at')
+
+
+def iter_users(created_from=None, created_to=None, batch_size=5000):
+    """Yield user rows in ``id`` order using keyset pagination (``WHERE id > last_id``).
+
+    Each batch is a separate short query that ends its transaction, so memory stays
+    constant and no snapshot is held open for the length of the export.
+    """
+    last_id = 0
+    while True:
+        query = (
+            db.select(User.id, User.name, User.email, User.created_at)
+            .where(User.id > last_id)
+            .order_by(User.id)
+            .limit(batch_size)
+        )
+        if created_from is not None:
+            query = query.where(User.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(User.created_at < created_to)
+        rows = db.session.execute(query).all()
+        db.session.rollback()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
+
+
+def export_users(fmt, created_from=None, created_to=None, batch_size=5000):
+    """Yield the ``users`` table as CSV (with header) or NDJSON text, one row at a time."""
+    rows = iter_users(created_from, created_to, batch_size)
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow((row.id, row.name, row.email, row.created_at.isoformat() if row.created_at else ''))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+        return
+    for row in rows:
+        yield json.dumps({
+            'id': row.id,
+            'name': row.name,
+            'email': row.email,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+        }) + '\n'
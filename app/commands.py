@@ -0,0 +1,182 @@
+import logging
+import os
+import secrets
+import time
+
+import click
+
+from . import db
+from .bulk import UserImporter, export_users
+from .models import User
+from .hashing import argon2, benchmark_method, percentile
+from .maintenance import purge_expired_tokens
+from .outbox import drain_outbox, smtp_sender
+from .partitions import maintain_partitions
+from .utils import normalize_email
+
+DEFAULT_BENCHMARK_METHODS = (
+    'pbkdf2:sha256:100000',
+    'pbkdf2:sha256:300000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:1000000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:65536:8:1',
+)
+ARGON2_BENCHMARK_METHODS = (
+    'argon2id:2:19456:1',
+    'argon2id:3:65536:4',
+)
+
+
+def init_commands(app):
+    # CLI: Purge expired tokens
+    @app.cli.command('purge-tokens')
+    @click.option('--batch-size', default=None, type=int, help='Rows deleted per transaction.')
+    @click.option('--pause', default=None, type=float, help='Seconds to sleep between batches.')
+    def purge_tokens(batch_size, pause):
+        """Delete expired rows from revoked_tokens, refresh_tokens and reset_tokens."""
+        purged = purge_expired_tokens(
+            batch_size=batch_size or app.config['TOKEN_PURGE_BATCH_SIZE'],
+            pause=app.config['TOKEN_PURGE_PAUSE'] if pause is None else pause,
+            revocation=app.extensions['revocation'],
+        )
+        for table, count in purged.items():
+            click.echo(f'Purged {count} expired rows from {table}')
+
+    # CLI: Maintain token table partitions
+    @app.cli.command('maintain-partitions')
+    @click.option('--days-ahead', default=14, show_default=True,
+                  help='Days of future partitions to keep; must cover the refresh token lifetime.')
+    def maintain_partitions_command(days_ahead):
+        """Create upcoming daily partitions and drop fully expired ones."""
+        created, dropped = maintain_partitions(days_ahead=days_ahead)
+        for name in created:
+            click.echo(f'Created {name}')
+        for name in dropped:
+            click.echo(f'Dropped {name}')
+
+    # CLI: Benchmark password hash methods
+    @app.cli.command('benchmark-hashes')
+    @click.option('--method', 'methods', multiple=True,
+                  help='Method to benchmark, e.g. pbkdf2:sha256:600000 (repeatable). Defaults to a preset sweep.')
+    @click.option('--samples', default=20, show_default=True, help='Verifications timed per method.')
+    def benchmark_hashes(methods, samples):
+        """Measure password verify latency per hash method and cost on this machine."""
+        if not methods:
+            methods = DEFAULT_BENCHMARK_METHODS + (ARGON2_BENCHMARK_METHODS if argon2 else ())
+        click.echo(f"Configured: {app.config['PASSWORD_HASH_METHOD']}, {os.cpu_count()} cores")
+        click.echo(f"{'method':<28}{'p50 ms':>10}{'p99 ms':>10}{'verifies/s/core':>18}")
+        for method in methods:
+            result = benchmark_method(method, samples=samples)
+            click.echo(
+                f"{result['method']:<28}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                f"{result['verifies_per_sec_per_core']:>18.1f}"
+            )
+
+    # CLI: Benchmark sign-in latency for existing vs unknown emails
+    @app.cli.command('benchmark-signin')
+    @click.option('--email', required=True, help='Email of an existing user.')
+    @click.option('--samples', default=50, show_default=True, help='Sign-in attempts per case.')
+    def benchmark_signin(email, samples):
+        """Compare /api/signin latency for an existing and an unknown email (both with a wrong password)."""
+        client = app.test_client()
+        cases = {'existing': email, 'unknown': f'missing-{secrets.token_hex(8)}@example.com'}
+        click.echo(f"{'case':<12}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for case, case_email in cases.items():
+            timings = []
+            for _ in range(samples):
+                start = time.perf_counter()
+                client.post('/api/signin', json={'email': case_email, 'password': secrets.token_urlsafe(12)})
+                timings.append(time.perf_counter() - start)
+            click.echo(
+                f"{case:<12}{percentile(timings, 50) * 1000:>10.1f}{percentile(timings, 99) * 1000:>10.1f}"
+                f"{sum(timings) / len(timings) * 1000:>10.1f}"
+            )
+
+    # CLI: Grant or revoke admin rights
+    @app.cli.command('set-admin')
+    @click.argument('email')
+    @click.option('--revoke', is_flag=True, help='Remove admin rights instead.')
+    def set_admin(email, revoke):
+        """Grant (or with --revoke, remove) admin rights for a user."""
+        user = User.query.filter(db.func.lower(User.email) == normalize_email(email)).first()
+        if not user:
+            raise click.ClickException(f'No user with email {email}')
+        user.is_admin = not revoke
+        app.extensions['user_cache'].changed(user_id=user.id)
+        db.session.commit()
+        click.echo(f"{email} is {'no longer' if revoke else 'now'} an admin")
+
+    # CLI: Bulk user import
+    @app.cli.command('import-users')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+                  help='Input format; guessed from the file extension by default.')
+    @click.option('--prehashed', is_flag=True, help='Rows carry password_hash instead of password.')
+    @click.option('--chunk-size', default=None, type=int, help='Rows per COPY transaction.')
+    @click.option('--workers', default=None, type=int, help='Hashing processes (default: all cores).')
+    def import_users(path, fmt, prehashed, chunk_size, workers):
+        """Load users from a CSV (name,email,password) or NDJSON file."""
+        fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+        importer = UserImporter(
+            method=app.config['PASSWORD_HASH_METHOD'],
+            prehashed=prehashed,
+            chunk_size=chunk_size or app.config['IMPORT_CHUNK_SIZE'],
+            workers=workers or app.config['IMPORT_HASH_WORKERS'],
+        )
+        with open(path, encoding='utf-8', newline='') as lines:
+            report = importer.run(lines, fmt)
+        # Web workers may have the imported emails cached as unknown
+        app.extensions['user_cache'].changed()
+        db.session.commit()
+        for error in report['errors']:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
+        click.echo(
+            f"Imported {report['imported']} users, {report['failed']} failed, "
+            f"{report['seconds']}s ({report['rows_per_sec']} rows/s)"
+        )
+
+    # CLI: Streaming user export
+    @app.cli.command('export-users')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='ndjson', show_default=True)
+    @click.option('--output', type=click.File('w'), default='-', help='Output file (default: stdout).')
+    @click.option('--created-from', type=click.DateTime(), default=None, help='Only users created at or after this time.')
+    @click.option('--created-to', type=click.DateTime(), default=None, help='Only users created before this time.')
+    @click.option('--batch-size', default=None, type=int, help='Rows fetched per keyset page.')
+    def export_users_command(fmt, output, created_from, created_to, batch_size):
+        """Stream the users table as CSV or NDJSON in id order."""
+        batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+        for chunk in export_users(fmt, created_from, created_to, batch_size=batch_size):
+            output.write(chunk)
+
+    # CLI: Email outbox worker
+    @app.cli.command('run-email-worker')
+    @click.option('--batch-size', default=None, type=int, help='Messages claimed per transaction.')
+    @click.option('--poll-interval', default=None, type=float, help='Seconds to sleep when the outbox is empty.')
+    @click.option('--once', is_flag=True, help='Drain the outbox once and exit.')
+    def run_email_worker(batch_size, poll_interval, once):
+        """Deliver queued emails from email_outbox; run as many of these as you like."""
+        batch_size = batch_size or app.config['EMAIL_OUTBOX_BATCH_SIZE']
+        poll_interval = app.config['EMAIL_OUTBOX_POLL_INTERVAL'] if poll_interval is None else poll_interval
+        mailer = app.extensions.get('mailer')
+        send = smtp_sender(app.config, mailer)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    sent, failed = drain_outbox(send, batch_size, app.config['EMAIL_MAX_ATTEMPTS'])
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Email outbox drain failed: {str(e)}")
+                    sent, failed = 0, 0
+                if sent or failed:
+                    click.echo(f'Sent {sent} emails, {failed} failed ({sent / (time.perf_counter() - start):.1f}/s)')
+                if sent + failed < batch_size:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+        finally:
+            if mailer is not None:
+                click.echo(f'SMTP pool: {mailer.stats()}')
+                mailer.close()
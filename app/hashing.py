@@ -0,0 +1,180 @@
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi is only needed for argon2id hashes
+    argon2 = None
+
+
+def _argon2_hasher(method):
+    # method is 'argon2id' or 'argon2id:<time_cost>:<memory_cost KiB>:<parallelism>'
+    if argon2 is None:
+        raise RuntimeError('argon2id password hashing requires the argon2-cffi package')
+    params = [int(p) for p in method.split(':')[1:]]
+    kwargs = dict(zip(('time_cost', 'memory_cost', 'parallelism'), params))
+    return argon2.PasswordHasher(type=argon2.Type.ID, **kwargs)
+
+
+def generate_hash(password, method):
+    """Hash ``password`` with a werkzeug method string (``pbkdf2:sha256:600000``,
+    ``scrypt:32768:8:1``) or ``argon2id[:t:m:p]``."""
+    if method.startswith('argon2id'):
+        return _argon2_hasher(method).hash(password)
+    return generate_password_hash(password, method=method)
+
+
+def verify_hash(pwhash, password):
+    """Check ``password`` against a hash produced by any supported method; unknown formats never match."""
+    if pwhash.startswith('$argon2'):
+        if argon2 is None:
+            raise RuntimeError('argon2id password hashing requires the argon2-cffi package')
+        try:
+            return argon2.PasswordHasher().verify(pwhash, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHash):
+            return False
+    try:
+        return check_password_hash(pwhash, password)
+    except ValueError:  # werkzeug's "Invalid hash method"
+        return False
+
+
+def is_supported_hash(pwhash):
+    """True if ``pwhash`` looks like a hash ``verify_hash`` can check: werkzeug ``pbkdf2:``/``scrypt:``
+    (``method$salt$hash``) or ``$argon2id$`` when argon2-cffi is installed."""
+    if pwhash.startswith('$argon2id$'):
+        return argon2 is not None
+    parts = pwhash.split('$')
+    return (
+        len(parts) == 3
+        and all(parts)
+        and (parts[0].startswith('pbkdf2:') or parts[0].startswith('scrypt:'))
+    )
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, int(round(pct / 100 * len(ordered))) - 1)]
+
+
+def benchmark_method(method, samples=20):
+    """Time ``samples`` verifications of a hash made with ``method`` on this machine."""
+    pwhash = generate_hash('benchmark-password', method)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        verify_hash(pwhash, 'benchmark-password')
+        timings.append(time.perf_counter() - start)
+    return {
+        'method': method,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'verifies_per_sec_per_core': len(timings) / sum(timings),
+    }
+
+
+class HashPoolSaturated(Exception):
+    """Raised when the hashing pool already has as much work as it is allowed to queue."""
+
+
+class HashTimeout(HashPoolSaturated):
+    """Raised when a hash job does not finish within the pool's ``timeout``; it keeps its slot until it does."""
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a dedicated, bounded worker pool.
+
+    At most ``workers + queue_limit`` jobs are admitted at once; beyond that callers get
+    ``HashPoolSaturated`` straight away instead of piling up on the request threads. A job still
+    holds its slot after its caller gives up waiting on it (``HashTimeout``), so abandoned work
+    keeps counting against the limit until a worker has actually finished it.
+    ``hashlib`` releases the GIL while deriving keys, so a thread pool is usually enough; a
+    process pool is available for hashers that do not.
+
+    New hashes use ``method``; hashes made with any other supported method or cost still
+    verify, and ``needs_rehash`` tells callers when to upgrade them.
+
+    ``dummy_hash`` is a hash of a random secret made with ``method``, for callers that need to
+    spend the same verify cost when there is no real hash to check against.
+    """
+
+    def __init__(self, method='pbkdf2:sha256', workers=None, queue_limit=32, kind='thread', timeout=30):
+        self.method = method
+        self.dummy_hash = generate_hash(secrets.token_urlsafe(32), method)
+        # werkzeug fills in default costs, so learn the exact prefix it writes for this method
+        self.prefix = None if method.startswith('argon2id') else self.dummy_hash.split('$', 1)[0]
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self.kind = kind
+        self.timeout = timeout
+        executor_cls = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+        self._executor = executor_cls(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(self.workers + queue_limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolSaturated()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashTimeout() from None
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(verify_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        if self.prefix is None:
+            return not pwhash.startswith('$argon2id$') or _argon2_hasher(self.method).check_needs_rehash(pwhash)
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'pool': self.kind,
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+
+def init_hasher(app):
+    hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_limit=app.config['PASSWORD_HASH_QUEUE_LIMIT'],
+        kind=app.config['PASSWORD_HASH_POOL'],
+    )
+    app.extensions['password_hasher'] = hasher
+    return hasher
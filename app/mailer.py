@@ -0,0 +1,175 @@
+import smtplib
+import threading
+import time
+from collections import deque
+
+
+class SmtpPool:
+    """Keeps up to ``size`` authenticated SMTP sessions open and reuses them across messages.
+
+    A session that has sat idle for more than ``noop_after`` seconds is probed with ``NOOP``
+    before reuse and replaced if the server has dropped it; sessions idle for more than
+    ``max_idle`` seconds are closed instead, ahead of typical server-side idle timeouts.
+    """
+
+    def __init__(self, host, port=25, username='', password='', starttls=False, timeout=10,
+                 size=2, noop_after=5, max_idle=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.size = size
+        self.noop_after = noop_after
+        self.max_idle = max_idle
+        self._idle = deque()  # (smtp, last used) pairs, most recently used last
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reconnects = 0
+        self.health_check_failures = 0
+        self.expired = 0
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.send_seconds = 0.0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+        with self._lock:
+            self.connects += 1
+        return smtp
+
+    def _close(self, smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _alive(self, smtp):
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise smtplib.SMTPException('No SMTP connection available')
+        try:
+            while True:
+                with self._lock:
+                    smtp, last_used = self._idle.pop() if self._idle else (None, None)
+                if smtp is None:
+                    return self._connect()
+                idle = time.monotonic() - last_used
+                if idle > self.max_idle:
+                    self._close(smtp)
+                    with self._lock:
+                        self.expired += 1
+                elif idle > self.noop_after and not self._alive(smtp):
+                    smtp.close()
+                    with self._lock:
+                        self.health_check_failures += 1
+                else:
+                    return smtp
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, smtp):
+        if smtp is not None:
+            with self._lock:
+                self._idle.append((smtp, time.monotonic()))
+        self._slots.release()
+
+    def send_batch(self, messages):
+        """Send ``messages`` one after another over a single session; returns an error (or ``None``) per message.
+
+        A session the server drops mid-batch is reconnected once per message. A rejected message
+        does not affect the others.
+        """
+        start = time.perf_counter()
+        try:
+            smtp = self._checkout()
+        except (smtplib.SMTPException, OSError) as e:
+            self._record(start, 0, len(messages))
+            return [e] * len(messages)
+        errors = []
+        try:
+            for msg in messages:
+                try:
+                    try:
+                        smtp.send_message(msg)
+                    except smtplib.SMTPServerDisconnected:
+                        smtp.close()
+                        smtp = None
+                        smtp = self._connect()
+                        with self._lock:
+                            self.reconnects += 1
+                        smtp.send_message(msg)
+                except (smtplib.SMTPException, OSError) as e:
+                    errors.append(e)
+                    if smtp is None:
+                        errors.extend([e] * (len(messages) - len(errors)))
+                        break
+                else:
+                    errors.append(None)
+        finally:
+            self._checkin(smtp)
+        failed = sum(1 for e in errors if e is not None)
+        self._record(start, len(messages) - failed, failed)
+        return errors
+
+    def _record(self, start, sent, failed):
+        with self._lock:
+            self.batches += 1
+            self.sent += sent
+            self.failed += failed
+            self.send_seconds += time.perf_counter() - start
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for smtp, _ in idle:
+            self._close(smtp)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'health_check_failures': self.health_check_failures,
+            'expired': self.expired,
+            'batches': self.batches,
+            'sent': self.sent,
+            'failed': self.failed,
+            'messages_per_sec': round(self.sent / self.send_seconds, 1) if self.send_seconds else 0.0,
+        }
+
+
+def init_mailer(app):
+    if not app.config['SMTP_HOST']:
+        return None
+    pool = SmtpPool(
+        host=app.config['SMTP_HOST'],
+        port=app.config['SMTP_PORT'],
+        username=app.config['SMTP_USERNAME'],
+        password=app.config['SMTP_PASSWORD'],
+        starttls=app.config['SMTP_STARTTLS'],
+        timeout=app.config['SMTP_TIMEOUT'],
+        size=app.config['SMTP_POOL_SIZE'],
+        noop_after=app.config['SMTP_NOOP_AFTER'],
+        max_idle=app.config['SMTP_MAX_IDLE'],
+    )
+    app.extensions['mailer'] = pool
+    return pool
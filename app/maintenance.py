@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from . import db
+from .models import RefreshToken, ResetToken, RevokedToken
+
+
+def purge_expired(model, batch_size=500, pause=0.0, on_purged=None, returning=None):
+    """Delete rows of ``model`` whose ``expires_at`` has passed, ``batch_size`` rows per transaction.
+
+    Each batch picks its rows with ``FOR UPDATE SKIP LOCKED`` through the ``expires_at`` index,
+    so it never waits on rows a request is touching. Short batches keep row locks and WAL
+    bursts small; ``pause`` seconds are slept between batches. ``on_purged`` receives the
+    ``returning`` column (default: ``id``) of the rows removed by each batch.
+    """
+    returning = returning if returning is not None else model.id
+    total = 0
+    while True:
+        expired = (
+            db.select(model.id, model.expires_at)
+            .where(model.expires_at < datetime.utcnow())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = db.session.execute(
+            db.delete(model).where(db.tuple_(model.id, model.expires_at).in_(expired)).returning(returning)
+        )
+        purged = result.scalars().all()
+        db.session.commit()
+        if on_purged and purged:
+            on_purged(purged)
+        total += len(purged)
+        if len(purged) < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def purge_expired_tokens(batch_size=500, pause=0.0, revocation=None):
+    """Purge expired revoked, refresh and reset tokens; returns row counts per table."""
+    return {
+        'revoked_tokens': purge_expired(
+            RevokedToken, batch_size, pause,
+            on_purged=revocation.forget if revocation else None,
+            returning=RevokedToken.jti,
+        ),
+        'refresh_tokens': purge_expired(RefreshToken, batch_size, pause),
+        'reset_tokens': purge_expired(ResetToken, batch_size, pause),
+    }
+
+
+class Janitor(threading.Thread):
+    """Daemon thread that runs ``job`` inside an app context every ``interval`` seconds."""
+
+    def __init__(self, app, job, interval):
+        super().__init__(name='janitor', daemon=True)
+        self.app = app
+        self.job = job
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.job()
+            except Exception as e:
+                logging.error(f"Janitor job failed: {str(e)}")
+                with self.app.app_context():
+                    db.session.rollback()
+
+
+def init_janitor(app):
+    interval = app.config['TOKEN_PURGE_INTERVAL']
+    if not interval:
+        return None
+    revocation = app.extensions['revocation']
+
+    def job():
+        purged = purge_expired_tokens(
+            batch_size=app.config['TOKEN_PURGE_BATCH_SIZE'],
+            pause=app.config['TOKEN_PURGE_PAUSE'],
+            revocation=revocation,
+        )
+        if any(purged.values()):
+            logging.info(f"Purged expired tokens: {purged}")
+
+    janitor = Janitor(app, job, interval)
+    app.extensions['janitor'] = janitor
+    janitor.start()
+    return janitor
@@ -1,48 +1,92 @@
 from . import db
 from datetime import datetime
+from sqlalchemy import DDL, event
 
 class User(db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), nullable=False)  # stored normalized, see utils.normalize_email
     password = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     def __repr__(self):
         return f'<User {self.email}>'
 
+# Email lookups filter on lower(email) so they probe this index whatever case the client sent
+db.Index('uq_users_email_lower', db.func.lower(User.email), unique=True)
+
 class ResetToken(db.Model):
     __tablename__ = 'reset_tokens'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    token = db.Column(db.String(100), unique=True, nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, nullable=False)  # one live token per user
+    token_hash = db.Column(db.LargeBinary(32), unique=True, nullable=False)  # utils.hash_token(token)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     user = db.relationship('User', backref=db.backref('reset_tokens', lazy=True))
 
     def __repr__(self):
-        return f'<ResetToken {self.token}>'
+        return f'<ResetToken {self.token_hash.hex()}>'
 
+# Mail waiting for `flask run-email-worker`; rows are written in the same transaction as the
+# record that triggered them and deleted once delivered (see app/outbox.py)
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} to {self.recipient}>'
+
+# revoked_tokens and refresh_tokens are range-partitioned by expiry day (see app/partitions.py),
+# so the partition key has to be part of every primary key and unique constraint.
 class RevokedToken(db.Model):
     __tablename__ = 'revoked_tokens'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(120), unique=True, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('jti', 'expires_at'),
+        {'postgresql_partition_by': 'RANGE (expires_at)'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(120), nullable=False)
     revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, primary_key=True, index=True)  # the token's own exp
 
     def __repr__(self):
         return f'<RevokedToken {self.jti}>'
 
 class RefreshToken(db.Model):
     __tablename__ = 'refresh_tokens'
+    __table_args__ = (
+        db.UniqueConstraint('jti_hash', 'expires_at'),
+        {'postgresql_partition_by': 'RANGE (expires_at)'},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    token = db.Column(db.String(1000), nullable=False, unique=True)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    jti_hash = db.Column(db.LargeBinary(32), nullable=False)  # utils.hash_token(jti)
+    family_id = db.Column(db.LargeBinary(16), index=True)  # shared by every rotation of one sign-in
+    expires_at = db.Column(db.DateTime, primary_key=True, index=True)
     user = db.relationship('User', backref=db.backref('refresh_tokens', lazy=True))
 
     def __repr__(self):
-        return f'<RefreshToken {self.token}>'
\ No newline at end of file
+        return f'<RefreshToken {self.jti_hash.hex()}>'
+
+# Rows outside every daily partition land here until `flask maintain-partitions` runs
+for _table in (RevokedToken.__table__, RefreshToken.__table__):
+    event.listen(
+        _table,
+        'after_create',
+        DDL(f'CREATE TABLE IF NOT EXISTS {_table.name}_default PARTITION OF {_table.name} DEFAULT').execute_if(dialect='postgresql'),
+    )
@@ -0,0 +1,88 @@
+import logging
+import select
+import threading
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from . import db
+
+REVOKED_TOKENS_CHANNEL = 'revoked_tokens'
+TOKEN_VERSIONS_CHANNEL = 'token_versions'
+USERS_CHANNEL = 'users'
+
+
+def notify(channel, payload):
+    """Queue a NOTIFY on the current session; Postgres delivers it only if the transaction commits."""
+    db.session.execute(db.text('SELECT pg_notify(:channel, :payload)'), {'channel': channel, 'payload': payload})
+
+
+class PgListener(threading.Thread):
+    """Background thread holding a dedicated LISTEN connection and dispatching notifications.
+
+    Callbacks run on this thread. A subscriber's ``resync`` hook runs each time ``LISTEN`` has
+    been issued, including the first, so it can rebuild whatever state it derives from
+    notifications sent while no connection was listening (before startup or while down).
+    """
+
+    def __init__(self, connect_args, reconnect_delay=5, poll_timeout=5):
+        super().__init__(name='pg-listener', daemon=True)
+        self.connect_args = connect_args
+        self.reconnect_delay = reconnect_delay
+        self.poll_timeout = poll_timeout
+        self.callbacks = {}
+        self.resync_hooks = []
+        self.received = 0
+        self._stopped = threading.Event()
+
+    def subscribe(self, channel, callback, resync=None):
+        self.callbacks[channel] = callback
+        if resync is not None:
+            self.resync_hooks.append(resync)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_args)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    for channel in self.callbacks:
+                        cur.execute(f'LISTEN "{channel}"')
+                for resync in self.resync_hooks:
+                    resync()
+                self._listen(conn)
+            except Exception as e:
+                logging.error(f"LISTEN connection lost: {str(e)}")
+                self._stopped.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stopped.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                self.received += 1
+                callback = self.callbacks.get(notification.channel)
+                if callback is None:
+                    continue
+                try:
+                    callback(notification.payload)
+                except Exception as e:
+                    logging.error(f"Error handling {notification.channel} notification: {str(e)}")
+
+
+def init_listener(app):
+    url = db.engine.url
+    connect_args = url.translate_connect_args(username='user', database='dbname')
+    connect_args.update(url.query)
+    listener = PgListener(connect_args)
+    app.extensions['pg_listener'] = listener
+    return listener
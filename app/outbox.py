@@ -0,0 +1,64 @@
+import logging
+from datetime import datetime, timedelta
+
+from . import db
+from .models import EmailOutbox
+from .utils import build_email
+
+MAX_RETRY_DELAY = 3600  # seconds
+
+
+def queue_email(recipient, subject, body):
+    """Add a message to the outbox in the caller's transaction; nothing is sent until it commits."""
+    db.session.add(EmailOutbox(recipient=recipient, subject=subject, body=body))
+
+
+def smtp_sender(config, pool=None):
+    """Return ``send(rows)`` that delivers outbox rows over one pooled SMTP session and returns an
+    error (or ``None``) per row.
+
+    Without a pool (no ``SMTP_HOST``) the messages are only logged, which is enough for local development.
+    """
+    def send(rows):
+        messages = [build_email(config['MAIL_FROM'], row.recipient, row.subject, row.body) for row in rows]
+        if pool is None:
+            for msg in messages:
+                logging.info(f"SMTP_HOST not set, not sending email:\n{msg.as_string()}")
+            return [None] * len(messages)
+        return pool.send_batch(messages)
+    return send
+
+
+def drain_outbox(send, batch_size=100, max_attempts=8):
+    """Deliver one batch of due outbox rows with a single ``send(rows)`` call; returns ``(sent, failed)``.
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED``, so any number of workers can drain the
+    table without sending a message twice. Delivered rows are deleted in the same commit that
+    releases the batch (delivery is at-least-once: a crash before that commit resends it).
+    Failed rows are retried with exponential backoff and dropped after ``max_attempts``.
+    """
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        db.select(EmailOutbox)
+        .where(EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    errors = send(rows) if rows else []
+    sent = failed = 0
+    for row, error in zip(rows, errors):
+        if error is None:
+            db.session.delete(row)
+            sent += 1
+            continue
+        failed += 1
+        row.attempts += 1
+        row.last_error = str(error)
+        if row.attempts >= max_attempts:
+            logging.error(f"Dropping email {row.id} to {row.recipient} after {row.attempts} attempts: {str(error)}")
+            db.session.delete(row)
+        else:
+            row.next_attempt_at = now + timedelta(seconds=min(2 ** row.attempts, MAX_RETRY_DELAY))
+    db.session.commit()
+    return sent, failed
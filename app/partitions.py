@@ -0,0 +1,66 @@
+import re
+from datetime import datetime, timedelta
+
+from . import db
+
+PARTITIONED_TABLES = ('revoked_tokens', 'refresh_tokens')
+PARTITION_SUFFIX = re.compile(r'_p(\d{8})$')
+
+
+def partition_name(table, day):
+    return f'{table}_p{day:%Y%m%d}'
+
+
+def create_partition(table, day):
+    """Create the partition holding rows that expire on ``day``; returns ``False`` if it exists.
+
+    The partition is built as a plain table, any rows for that day are moved out of the
+    DEFAULT partition, and only then is it attached, since Postgres refuses to attach a range
+    that the DEFAULT partition still holds rows for.
+    """
+    name = partition_name(table, day)
+    if db.session.execute(db.text('SELECT to_regclass(:name)'), {'name': name}).scalar():
+        return False
+    lo, hi = day, day + timedelta(days=1)
+    db.session.execute(db.text(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    db.session.execute(db.text(
+        f'WITH moved AS (DELETE FROM {table}_default WHERE expires_at >= :lo AND expires_at < :hi RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), {'lo': lo, 'hi': hi})
+    db.session.execute(db.text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+    db.session.commit()
+    return True
+
+
+def drop_expired_partitions(table, today):
+    """Drop daily partitions whose whole range lies before ``today``."""
+    children = db.session.execute(db.text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        'JOIN pg_class p ON p.oid = i.inhparent '
+        'WHERE p.relname = :table'
+    ), {'table': table}).scalars().all()
+    dropped = []
+    for name in children:
+        match = PARTITION_SUFFIX.search(name)
+        if not match:
+            continue
+        day = datetime.strptime(match.group(1), '%Y%m%d').date()
+        if day + timedelta(days=1) <= today:
+            db.session.execute(db.text(f'DROP TABLE {name}'))
+            dropped.append(name)
+    db.session.commit()
+    return dropped
+
+
+def maintain_partitions(days_ahead=14):
+    """Create partitions for today through ``days_ahead`` days out and drop expired ones."""
+    today = datetime.utcnow().date()
+    created, dropped = [], []
+    for table in PARTITIONED_TABLES:
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if create_partition(table, day):
+                created.append(partition_name(table, day))
+        dropped.extend(drop_expired_partitions(table, today))
+    return created, dropped
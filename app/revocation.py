@@ -0,0 +1,288 @@
+import calendar
+import logging
+import threading
+import time
+from datetime import datetime
+
+from . import db
+from .bloom import CountingBloomFilter
+from .cache import TTLCache
+from .maintenance import Janitor
+from .models import RevokedToken, User
+from .notify import REVOKED_TOKENS_CHANNEL, TOKEN_VERSIONS_CHANNEL
+from .shm import LOAD_TIMEOUT, SharedRevocationTable
+
+
+class RevocationChecker:
+    """Answers ``token_in_blocklist_loader`` lookups, caching both revoked and known-good JTIs.
+
+    Revoked JTIs never become valid again, so a cached ``True`` is always correct. A cached
+    ``False`` can go stale when another worker revokes the token, for at most
+    ``REVOCATION_CACHE_TTL`` seconds.
+
+    With a Bloom filter enabled, JTIs the filter has never seen are answered without touching
+    the cache or the database; only possible hits fall through to ``revoked_tokens``.
+
+    When Postgres LISTEN/NOTIFY is enabled, every logout is broadcast on the
+    ``revoked_tokens`` channel and applied here through ``apply``, which keeps the
+    filter and cache of every worker in step with the others.
+
+    With a shared-memory table, all workers on the host probe one table of revoked JTIs that
+    ``/api/logout`` writes into directly; the database is only consulted while the table is
+    still being loaded or after it has run out of slots.
+    """
+
+    def __init__(self, maxsize, ttl, bloom=None, shared=None):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.bloom = bloom
+        self.shared = shared
+        self.bloom_negatives = 0
+        self.bloom_positives = 0
+        self.bloom_false_positives = 0
+        self._pending = None  # JTIs marked revoked while load() is scanning
+        # JTIs this process marked recently, kept apart from ``cache`` so the dedupe below
+        # holds even with REVOCATION_CACHE_SIZE=0
+        self._marked = TTLCache(maxsize=10000, ttl=60)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # the rebuild thread and the listener's resync both load
+
+    def load(self):
+        """(Re)build the Bloom filter from the unexpired rows of ``revoked_tokens``.
+
+        Run periodically as well, since purged JTIs are only ``forget``-ed by the process that
+        deleted them. JTIs marked revoked while the table is being scanned are carried over.
+        Expired tokens are rejected before the filter is consulted, so they are left out.
+        """
+        if self.bloom is None:
+            return
+        with self._load_lock:
+            with self._lock:
+                self._pending = []
+            bloom = CountingBloomFilter(capacity=self.bloom.capacity, fp_rate=self.bloom.fp_rate)
+            rows = (
+                db.session.query(RevokedToken.jti)
+                .filter(RevokedToken.expires_at > datetime.utcnow())
+                .yield_per(10000)
+            )
+            try:
+                for (jti,) in rows:
+                    bloom.add(jti)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            # Same lock as mark_revoked, so no JTI lands only in the filter being replaced
+            with self._lock:
+                for jti in self._pending:
+                    bloom.add(jti)
+                self._pending = None
+                self.bloom = bloom
+
+    def load_shared(self, top_up=False):
+        """Load the shared-memory table from the unexpired rows of ``revoked_tokens``.
+
+        The first load is done by whichever worker claims it, and taken over by another if that
+        worker stops making progress. With ``top_up`` a table that is already loaded gets the
+        rows again, for logouts broadcast while no worker on this host was listening.
+        """
+        if self.shared is None:
+            return
+        if self.shared.claim_load():
+            self._fill_shared()
+            self.shared.mark_ready()
+        elif top_up and self.shared.ready:
+            self._fill_shared()
+
+    def _fill_shared(self):
+        rows = (
+            db.session.query(RevokedToken.jti, RevokedToken.expires_at)
+            .filter(RevokedToken.expires_at > datetime.utcnow())
+            .yield_per(10000)
+        )
+        for i, (jti, expires_at) in enumerate(rows, start=1):
+            self.shared.add(jti, calendar.timegm(expires_at.utctimetuple()))
+            if i % 10000 == 0:
+                self.shared.heartbeat()
+
+    def is_revoked(self, jti, exp=None):
+        # An expired token is rejected anyway, and its row may already have been purged
+        if exp is not None and exp < time.time():
+            return True
+
+        if self.shared is not None and self.shared.ready:
+            if self.shared.contains(jti):
+                return True
+            if not self.shared.overflowed:
+                return False
+
+        if self.bloom is not None:
+            if not self.bloom.might_contain(jti):
+                self.bloom_negatives += 1
+                return False
+            self.bloom_positives += 1
+
+        revoked = self.cache.get(jti)
+        if revoked is None:
+            query = RevokedToken.query.filter_by(jti=jti)
+            if exp is not None:
+                # Lets Postgres prune the lookup to the one partition that can hold the row
+                query = query.filter_by(expires_at=datetime.utcfromtimestamp(exp))
+            revoked = query.first() is not None
+            if self.bloom is not None and not revoked:
+                self.bloom_false_positives += 1
+            self.cache.set(jti, revoked)
+        return revoked
+
+    def mark_revoked(self, jti, exp=None):
+        with self._lock:
+            # The worker that handled the logout sees its own notification as well, in either
+            # order; adding the JTI to the counting filter twice would outlive one ``forget``
+            if self._marked.peek(jti):
+                return
+            self._marked.set(jti, True)
+            if self.bloom is not None:
+                self.bloom.add(jti)
+                if self._pending is not None:
+                    self._pending.append(jti)
+        if self.shared is not None:
+            self.shared.add(jti, exp)
+        self.cache.set(jti, True)
+
+    def apply(self, payload):
+        """Handle a ``<jti>:<exp>`` notification."""
+        jti, _, exp = payload.rpartition(':')
+        self.mark_revoked(jti, int(exp))
+
+    def forget(self, jtis):
+        """Drop purged JTIs from this process's Bloom filter; other workers shed them at their next ``load``."""
+        if self.bloom is None:
+            return
+        for jti in jtis:
+            self.bloom.remove(jti)
+
+    def stats(self):
+        stats = {'cache': self.cache.stats()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        if self.bloom is not None:
+            stats['bloom'] = dict(
+                self.bloom.stats(),
+                negatives=self.bloom_negatives,
+                positives=self.bloom_positives,
+                false_positives=self.bloom_false_positives,
+            )
+        return stats
+
+
+class TokenVersions:
+    """Per-user ``token_version`` lookups for the ``ver`` claim, cached by user id.
+
+    Bumping ``users.token_version`` invalidates every token issued to that user with a single
+    UPDATE. Other workers learn the new version through the ``token_versions`` channel, or
+    after ``ttl`` seconds when LISTEN/NOTIFY is off.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def current(self, user_id):
+        version = self.cache.get(user_id)
+        if version is None:
+            version = db.session.query(User.token_version).filter_by(id=int(user_id)).scalar()
+            if version is None:
+                return None
+            self.cache.set(user_id, version)
+        return version
+
+    def is_outdated(self, user_id, version):
+        current = self.current(user_id)
+        # Tokens issued before versioning was switched on carry no claim and count as version 0
+        return current is None or (version or 0) < current
+
+    def bump(self, user_id):
+        """Increment the user's version in the current transaction and return the new value."""
+        return db.session.execute(
+            db.update(User)
+            .where(User.id == int(user_id))
+            .values(token_version=User.token_version + 1)
+            .returning(User.token_version)
+        ).scalar()
+
+    def apply(self, payload):
+        """Handle a ``<user_id>:<version>`` notification."""
+        user_id, version = payload.split(':')
+        self.set(user_id, int(version))
+
+    def set(self, user_id, version):
+        if (self.cache.peek(user_id) or 0) < version:
+            self.cache.set(user_id, version)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+def init_revocation(app):
+    bloom = None
+    if app.config['REVOCATION_BLOOM_ENABLED'] and not app.config['PG_NOTIFY_ENABLED']:
+        # Without NOTIFY a filter never hears of logouts handled by other workers and would
+        # answer a definite "not revoked" for them
+        logging.warning("REVOCATION_BLOOM_ENABLED needs PG_NOTIFY_ENABLED; the Bloom filter is disabled")
+    elif app.config['REVOCATION_BLOOM_ENABLED']:
+        bloom = CountingBloomFilter(
+            capacity=app.config['REVOCATION_BLOOM_CAPACITY'],
+            fp_rate=app.config['REVOCATION_BLOOM_FP_RATE'],
+        )
+    shared = None
+    if app.config['REVOCATION_SHM_ENABLED'] and not app.config['PG_NOTIFY_ENABLED']:
+        # Same as the filter: logouts handled on other hosts would never reach this host's table
+        logging.warning("REVOCATION_SHM_ENABLED needs PG_NOTIFY_ENABLED; the shared-memory table is disabled")
+    elif app.config['REVOCATION_SHM_ENABLED']:
+        shared = SharedRevocationTable(
+            name=app.config['REVOCATION_SHM_NAME'],
+            slots=app.config['REVOCATION_SHM_SLOTS'],
+        )
+    checker = RevocationChecker(
+        maxsize=app.config['REVOCATION_CACHE_SIZE'],
+        ttl=app.config['REVOCATION_CACHE_TTL'],
+        bloom=bloom,
+        shared=shared,
+    )
+    with app.app_context():
+        checker.load()
+        checker.load_shared()
+
+    def resync():
+        # Runs once LISTEN is in place, first at startup and again after every reconnect;
+        # logouts committed before that (including since the load above) sent no notification here
+        with app.app_context():
+            checker.load()
+            checker.load_shared(top_up=True)
+        checker.cache.clear()
+
+    listener = app.extensions.get('pg_listener')
+    if listener is not None:
+        listener.subscribe(REVOKED_TOKENS_CHANNEL, checker.apply, resync=resync)
+
+    app.extensions['revocation'] = checker
+
+    if shared is not None and not shared.ready:
+        # Retries the load if the worker that claimed it dies part-way through
+        loader = Janitor(app, checker.load_shared, LOAD_TIMEOUT)
+        app.extensions['shm_loader'] = loader
+        loader.start()
+
+    if bloom is not None and app.config['REVOCATION_BLOOM_REBUILD_INTERVAL']:
+        rebuilder = Janitor(app, checker.load, app.config['REVOCATION_BLOOM_REBUILD_INTERVAL'])
+        app.extensions['bloom_rebuilder'] = rebuilder
+        rebuilder.start()
+
+    if app.config['TOKEN_VERSION_REVOCATION']:
+        versions = TokenVersions(
+            maxsize=app.config['REVOCATION_CACHE_SIZE'],
+            ttl=app.config['REVOCATION_CACHE_TTL'],
+        )
+        if listener is not None:
+            listener.subscribe(TOKEN_VERSIONS_CHANNEL, versions.apply, resync=versions.cache.clear)
+        app.extensions['token_versions'] = versions
+
+    return checker
@@ -1,15 +1,58 @@
-from flask import request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import request, jsonify, Response, stream_with_context, current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt, decode_token
+from sqlalchemy.dialects.postgresql import insert
 from .models import db, User, ResetToken, RevokedToken, RefreshToken
-from .utils import generate_reset_token, send_reset_email
+from .utils import generate_reset_token, reset_email, normalize_email, hash_token
+from .hashing import HashPoolSaturated, HashTimeout
+from .notify import notify, REVOKED_TOKENS_CHANNEL, TOKEN_VERSIONS_CHANNEL
+from .bulk import UserImporter, export_users
+from .outbox import queue_email
 from datetime import datetime, timedelta
+from functools import wraps
+import io
 import logging
+import secrets
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Claims copied from a refresh token into the access tokens it mints
+CARRIED_CLAIMS = ('ver', 'name', 'email')
+
+# Refresh token rotation: delete the presented token and insert its successor in the same
+# family, in one round trip. No row back means the presented token was not stored.
+ROTATE_REFRESH_TOKEN = db.text("""
+    WITH consumed AS (
+        DELETE FROM refresh_tokens
+        WHERE jti_hash = :old_hash AND expires_at = :old_exp AND user_id = :user_id
+        RETURNING user_id, family_id
+    )
+    INSERT INTO refresh_tokens (user_id, jti_hash, family_id, expires_at)
+    SELECT user_id, :new_hash, COALESCE(family_id, :family_id), :new_exp FROM consumed
+    RETURNING id
+""")
+
+def admin_required(fn):
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        user = current_app.extensions['user_cache'].get_by_id(get_jwt_identity())
+        if not user or not user.is_admin:
+            return jsonify({'message': 'Admin privileges required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
 def init_routes(app):
+    # Shed password work instead of queueing it behind a login storm
+    @app.errorhandler(HashPoolSaturated)
+    def hash_pool_saturated(e):
+        if isinstance(e, HashTimeout):
+            logging.warning("Password hashing timed out, rejecting request")
+        else:
+            logging.warning("Password hashing pool saturated, rejecting request")
+        retry_after = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+        return jsonify({'message': 'Server busy, please retry'}), 503, {'Retry-After': retry_after}
+
     # API: Signup
     @app.route('/api/signup', methods=['POST'])
     def api_signup():
@@ -31,15 +74,24 @@ def init_routes(app):
         if not name or not email or not password:
             logging.error("Missing required fields in API signup request")
             return jsonify({'message': 'Missing required fields'}), 400
+        email = normalize_email(email)
 
-        if User.query.filter_by(email=email).first():
-            logging.warning(f"Duplicate email attempted in API: {email}")
-            return jsonify({'message': 'User already exists'}), 400
+        hashed_password = app.extensions['password_hasher'].hash(password)
 
         try:
-            hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-            new_user = User(name=name, email=email, password=hashed_password)
-            db.session.add(new_user)
+            # One round trip; the unique index on lower(email) decides duplicates, with no race window
+            user_id = db.session.execute(
+                insert(User)
+                .values(name=name, email=email, password=hashed_password)
+                .on_conflict_do_nothing(index_elements=[db.func.lower(User.email)])
+                .returning(User.id)
+            ).scalar()
+            if user_id is None:
+                db.session.rollback()
+                logging.warning(f"Duplicate email attempted in API: {email}")
+                return jsonify({'message': 'User already exists'}), 400
+            # Drop any cached "no such email" entry, here and in the other workers
+            app.extensions['user_cache'].changed(email=email)
             db.session.commit()
             logging.info(f"User created successfully via API: {email}")
             return jsonify({'message': 'User created successfully'}), 201
@@ -65,18 +117,46 @@ def init_routes(app):
         if not email or not password:
             return jsonify({'message': 'Missing email or password'}), 400
 
-        user = User.query.filter_by(email=email).first()
+        user = app.extensions['user_cache'].get_by_email(email)
 
-        if not user or not check_password_hash(user.password, password):
+        # Unknown emails pay the same verify cost as real ones, so timing does not reveal accounts
+        hasher = app.extensions['password_hasher']
+        password_ok = hasher.verify(user.password if user else hasher.dummy_hash, password)
+        if not user or not password_ok:
             logging.warning(f"Invalid sign-in attempt for email: {email}")
             return jsonify({'message': 'Invalid credentials'}), 401
 
         try:
-            access_token = create_access_token(identity=str(user.id))
-            refresh_token = create_refresh_token(identity=str(user.id))
-            # Store refresh token
-            expires = datetime.utcnow() + timedelta(seconds=604800)  # 7 days
-            new_refresh_token = RefreshToken(user_id=user.id, token=refresh_token, expires_at=expires)
+            # Upgrade hashes made with an outdated method or cost while we have the plain password
+            if hasher.needs_rehash(user.password):
+                try:
+                    new_hash = hasher.hash(password)
+                    db.session.execute(db.update(User).where(User.id == user.id).values(password=new_hash))
+                    app.extensions['user_cache'].changed(user_id=user.id)
+                    logging.info(f"Password hash upgraded to {hasher.method} for user: {email}")
+                except HashPoolSaturated:
+                    pass  # try again on the next sign-in
+
+            claims = {}
+            if app.config['TOKEN_VERSION_REVOCATION']:
+                claims['ver'] = user.token_version
+            if app.config['JWT_PROFILE_CLAIMS']:
+                claims['name'] = user.name
+                claims['email'] = user.email
+            family = secrets.token_hex(16)
+            refresh_token = create_refresh_token(identity=str(user.id), additional_claims=dict(claims, fam=family))
+            refresh_claims = decode_token(refresh_token)
+            # The access token names its refresh token family so logout can revoke both
+            access_token = create_access_token(
+                identity=str(user.id), additional_claims=dict(claims, rjti=refresh_claims['jti'], fam=family)
+            )
+            # Store a digest of the refresh token's jti, keyed on its own exp so it lands in the matching partition
+            new_refresh_token = RefreshToken(
+                user_id=user.id,
+                jti_hash=hash_token(refresh_claims['jti']),
+                family_id=bytes.fromhex(family),
+                expires_at=datetime.utcfromtimestamp(refresh_claims['exp'])
+            )
             db.session.add(new_refresh_token)
             db.session.commit()
             logging.info(f"Sign-in successful for user: {email}")
@@ -96,21 +176,51 @@ def init_routes(app):
     @jwt_required(refresh=True)
     def api_refresh():
         current_user = get_jwt_identity()
-        refresh_jti = get_jwt()['jti']
+        old_claims = get_jwt()
+        # Tokens issued before rotation have no family yet; start one for them
+        family = old_claims.get('fam') or secrets.token_hex(16)
 
         try:
-            token = RefreshToken.query.filter_by(token=refresh_jti, user_id=int(current_user)).first()
-            if not token or token.expires_at <= datetime.utcnow():
-                logging.warning(f"Invalid or expired refresh token for user_id: {current_user}")
+            claims = {key: old_claims[key] for key in CARRIED_CLAIMS if key in old_claims}
+            new_refresh_token = create_refresh_token(identity=current_user, additional_claims=dict(claims, fam=family))
+            new_refresh_claims = decode_token(new_refresh_token)
+
+            # Consume the presented token and store its successor in one statement
+            rotated = db.session.execute(ROTATE_REFRESH_TOKEN, {
+                'old_hash': hash_token(old_claims['jti']),
+                'old_exp': datetime.utcfromtimestamp(old_claims['exp']),
+                'user_id': int(current_user),
+                'new_hash': hash_token(new_refresh_claims['jti']),
+                'new_exp': datetime.utcfromtimestamp(new_refresh_claims['exp']),
+                'family_id': bytes.fromhex(family),
+            }).first()
+
+            if rotated is None:
+                db.session.rollback()
+                if 'fam' in old_claims:
+                    # A validly signed token that is no longer stored was already rotated: it has leaked
+                    db.session.execute(
+                        db.delete(RefreshToken).where(RefreshToken.family_id == bytes.fromhex(family))
+                    )
+                    db.session.commit()
+                    logging.warning(f"Refresh token reuse detected, family revoked for user_id: {current_user}")
+                else:
+                    logging.warning(f"Invalid or expired refresh token for user_id: {current_user}")
                 return jsonify({'message': 'Invalid or expired refresh token'}), 401
 
-            new_access_token = create_access_token(identity=current_user)
+            db.session.commit()
+            # Carry claims over from the refresh token; it passed the version check, so 'ver' is current
+            claims['rjti'] = new_refresh_claims['jti']
+            claims['fam'] = family
+            new_access_token = create_access_token(identity=current_user, additional_claims=claims)
             logging.info(f"Access token refreshed for user_id: {current_user}")
             return jsonify({
                 'message': 'Token refreshed successfully',
-                'access_token': new_access_token
+                'access_token': new_access_token,
+                'refresh_token': new_refresh_token
             }), 200
         except Exception as e:
+            db.session.rollback()
             logging.error(f"Error refreshing token: {str(e)}")
             return jsonify({'message': 'Error refreshing token', 'error': str(e)}), 500
 
@@ -119,16 +229,23 @@ def init_routes(app):
     @jwt_required()
     def api_logout():
         jti = get_jwt()['jti']
+        exp = get_jwt()['exp']
         try:
             # Revoke access token
-            revoked_token = RevokedToken(jti=jti)
+            revoked_token = RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(exp))
             db.session.add(revoked_token)
-            # Revoke refresh token
-            refresh_jti = get_jwt()['jti']
-            refresh_token = RefreshToken.query.filter_by(token=refresh_jti).first()
-            if refresh_token:
-                db.session.delete(refresh_token)
+            # Revoke this session's refresh token. Deleting by family also catches the current one
+            # when this access token predates a rotation; older tokens only name their own rjti.
+            family = get_jwt().get('fam')
+            refresh_jti = get_jwt().get('rjti')
+            if family:
+                db.session.execute(db.delete(RefreshToken).where(RefreshToken.family_id == bytes.fromhex(family)))
+            elif refresh_jti:
+                db.session.execute(db.delete(RefreshToken).where(RefreshToken.jti_hash == hash_token(refresh_jti)))
+            if app.config['PG_NOTIFY_ENABLED']:
+                notify(REVOKED_TOKENS_CHANNEL, f'{jti}:{exp}')
             db.session.commit()
+            app.extensions['revocation'].mark_revoked(jti, exp)
             logging.info(f"Logout successful, tokens revoked: {jti}")
             return jsonify({'message': 'Logout successful. Tokens revoked.'}), 200
         except Exception as e:
@@ -136,6 +253,29 @@ def init_routes(app):
             logging.error(f"Error revoking tokens: {str(e)}")
             return jsonify({'message': 'Error during logout', 'error': str(e)}), 500
 
+    # API: Logout everywhere
+    @app.route('/api/logout-all', methods=['POST'])
+    @jwt_required()
+    def api_logout_all():
+        versions = app.extensions.get('token_versions')
+        if versions is None:
+            return jsonify({'message': 'Token versioning is not enabled'}), 400
+
+        current_user = get_jwt_identity()
+        try:
+            version = versions.bump(current_user)
+            if app.config['PG_NOTIFY_ENABLED']:
+                notify(TOKEN_VERSIONS_CHANNEL, f'{current_user}:{version}')
+            app.extensions['user_cache'].changed(user_id=current_user)
+            db.session.commit()
+            versions.set(current_user, version)
+            logging.info(f"All tokens revoked for user_id: {current_user}")
+            return jsonify({'message': 'Logged out from all sessions'}), 200
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error revoking all tokens: {str(e)}")
+            return jsonify({'message': 'Error during logout', 'error': str(e)}), 500
+
     # API: Forgot Password
     @app.route('/api/forgot-password', methods=['POST'])
     def api_forgot_password():
@@ -151,25 +291,44 @@ def init_routes(app):
         if not email:
             return jsonify({'message': 'Email is required'}), 400
 
-        user = User.query.filter_by(email=email).first()
+        user = app.extensions['user_cache'].get_by_email(email)
         if not user:
             return jsonify({'message': 'Email not found'}), 404
 
         try:
+            # One live token per user: replace it only once the resend window has passed (or it
+            # has expired); inside the window the upsert matches nothing and no email is queued
+            now = datetime.utcnow()
             token = generate_reset_token()
-            reset_token = ResetToken(
+            stmt = insert(ResetToken).values(
                 user_id=user.id,
-                token=token,
-                expires_at=datetime.utcnow() + timedelta(hours=1)
+                token_hash=hash_token(token),
+                created_at=now,
+                expires_at=now + timedelta(hours=1),
             )
-            db.session.add(reset_token)
+            issued = db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[ResetToken.user_id],
+                    set_={
+                        'token_hash': stmt.excluded.token_hash,
+                        'created_at': stmt.excluded.created_at,
+                        'expires_at': stmt.excluded.expires_at,
+                    },
+                    where=db.or_(
+                        ResetToken.created_at < now - timedelta(seconds=app.config['RESET_RESEND_WINDOW']),
+                        ResetToken.expires_at < now,
+                    ),
+                ).returning(ResetToken.id)
+            ).scalar()
+            if issued is None:
+                db.session.rollback()
+                logging.info(f"Password reset email suppressed for user: {email} (sent recently)")
+                return jsonify({'message': 'Password reset email sent'}), 200
+            # Delivered by `flask run-email-worker`; the email exists if and only if the token does
+            queue_email(user.email, *reset_email(token, app.config['RESET_URL']))
             db.session.commit()
             logging.info(f"Password reset token generated for user: {email}")
-
-            if send_reset_email(email, token):
-                return jsonify({'message': 'Password reset email sent'}), 200
-            else:
-                return jsonify({'message': 'Failed to send reset email'}), 500
+            return jsonify({'message': 'Password reset email sent'}), 200
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error in API forgot password: {str(e)}")
@@ -190,17 +349,26 @@ def init_routes(app):
         if not password:
             return jsonify({'message': 'New password is required'}), 400
 
-        token_data = ResetToken.query.filter_by(token=token).filter(ResetToken.expires_at > datetime.utcnow()).first()
-        if not token_data:
-            return jsonify({'message': 'Invalid or expired token'}), 400
-
         try:
-            user = User.query.get(token_data.user_id)
-            user.password = generate_password_hash(password, method='pbkdf2:sha256')
-            db.session.delete(token_data)
+            # Consume the token in one statement; of two concurrent requests only one gets a row back
+            user_id = db.session.execute(
+                db.delete(ResetToken)
+                .where(ResetToken.token_hash == hash_token(token), ResetToken.expires_at > datetime.utcnow())
+                .returning(ResetToken.user_id)
+            ).scalar()
+            if user_id is None:
+                db.session.rollback()
+                return jsonify({'message': 'Invalid or expired token'}), 400
+
+            hashed_password = app.extensions['password_hasher'].hash(password)
+            db.session.execute(db.update(User).where(User.id == user_id).values(password=hashed_password))
+            app.extensions['user_cache'].changed(user_id=user_id)
             db.session.commit()
-            logging.info(f"Password reset successful for user: {user.email}")
+            logging.info(f"Password reset successful for user_id: {user_id}")
             return jsonify({'message': 'Password reset successful'}), 200
+        except HashPoolSaturated:
+            db.session.rollback()  # the token stays valid for a retry
+            raise
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error resetting password: {str(e)}")
@@ -210,8 +378,16 @@ def init_routes(app):
     @app.route('/api/dashboard', methods=['GET'])
     @jwt_required()
     def api_dashboard():
+        # Tokens issued with JWT_PROFILE_CLAIMS carry the profile, so no database read is needed
+        claims = get_jwt()
+        if 'name' in claims and 'email' in claims:
+            return jsonify({
+                'message': f"Welcome {claims['name']}!",
+                'user': {'name': claims['name'], 'email': claims['email']}
+            }), 200
+
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = app.extensions['user_cache'].get_by_id(current_user_id)
 
         if not user:
             return jsonify({'message': 'User not found'}), 404
@@ -221,6 +397,62 @@ def init_routes(app):
             'user': {'name': user.name, 'email': user.email}
         }), 200
 
+    # API: Admin bulk user import
+    @app.route('/api/admin/users/import', methods=['POST'])
+    @admin_required
+    def api_admin_import_users():
+        content_type = request.mimetype
+        if content_type == 'text/csv':
+            fmt = 'csv'
+        elif content_type in ('application/x-ndjson', 'application/jsonl'):
+            fmt = 'ndjson'
+        else:
+            return jsonify({'message': 'Content-Type must be text/csv or application/x-ndjson'}), 415
+
+        importer = UserImporter(
+            method=app.config['PASSWORD_HASH_METHOD'],
+            prehashed=request.args.get('prehashed', 'false').lower() == 'true',
+            chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+            workers=app.config['IMPORT_HASH_WORKERS'],
+        )
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = importer.run(lines, fmt)
+        # Imported emails may be cached as unknown
+        app.extensions['user_cache'].changed()
+        db.session.commit()
+        logging.info(f"Bulk import: {report['imported']} users imported, {report['failed']} failed")
+        return jsonify(report), 200
+
+    # API: Admin user export
+    @app.route('/api/admin/users/export', methods=['GET'])
+    @admin_required
+    def api_admin_export_users():
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'message': 'format must be csv or ndjson'}), 400
+        try:
+            created_from = request.args.get('created_from')
+            created_to = request.args.get('created_to')
+            created_from = datetime.fromisoformat(created_from) if created_from else None
+            created_to = datetime.fromisoformat(created_to) if created_to else None
+        except ValueError:
+            return jsonify({'message': 'created_from and created_to must be ISO 8601 datetimes'}), 400
+
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        rows = export_users(fmt, created_from, created_to, batch_size=app.config['EXPORT_BATCH_SIZE'])
+        return Response(stream_with_context(rows), mimetype=mimetype)
+
+    # API: Metrics
+    @app.route('/api/metrics', methods=['GET'])
+    @admin_required
+    def api_metrics():
+        return jsonify({
+            'revocation': app.extensions['revocation'].stats(),
+            'password_hasher': app.extensions['password_hasher'].stats(),
+            'user_cache': app.extensions['user_cache'].stats(),
+            'token_versions': app.extensions['token_versions'].stats() if 'token_versions' in app.extensions else None
+        }), 200
+
     # API: Public
     @app.route('/api/public', methods=['GET'])
     def api_public():
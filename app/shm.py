@@ -0,0 +1,164 @@
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+HEADER = struct.Struct('<4sBBxxQQd')  # magic, ready, overflow, slots, count, load heartbeat (unix seconds)
+COUNT = struct.Struct('<Q')
+COUNT_OFFSET = 16
+HEARTBEAT = struct.Struct('<d')
+HEARTBEAT_OFFSET = 24
+SLOT = struct.Struct('<16sQ')  # blake2b-128 digest of the JTI, expiry (unix seconds, 0 = never)
+MAGIC = b'RVK2'
+EMPTY = bytes(16)
+MAX_PROBE = 64
+LOAD_TIMEOUT = 60  # seconds without a heartbeat before another worker takes over the initial load
+
+
+class SharedRevocationTable:
+    """Fixed-size open-addressing hash table of revoked JTIs in POSIX shared memory.
+
+    Every worker maps the same segment. Lookups are lock-free linear probes; inserts are
+    serialised across processes with ``flock`` on a side file. Slots are never emptied, only
+    overwritten once their token has expired, so probe chains never break under a reader.
+    Each slot's expiry is written before its digest, so a reader never pairs a fresh digest
+    with a stale expiry.
+
+    The segment outlives the workers; one left behind with a different layout or slot count is
+    replaced when the next worker starts.
+    """
+
+    def __init__(self, name, slots):
+        self.name = name
+        self._lock_path = os.path.join(tempfile.gettempdir(), f'{name}.lock')
+        size = HEADER.size + slots * SLOT.size
+        with self._locked():
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self.created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                self.created = False
+                magic, _, _, existing_slots, _, _ = HEADER.unpack_from(self._shm.buf, 0)
+                if magic != MAGIC or existing_slots != slots:
+                    # Left over from a run with another layout or size; workers still attached
+                    # to it keep their mapping until they exit
+                    logging.warning(f"Replacing shared-memory segment {name} ({existing_slots} slots, want {slots})")
+                    self._shm.close()
+                    self._shm.unlink()
+                    self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                    self.created = True
+            if self.created:
+                HEADER.pack_into(self._shm.buf, 0, MAGIC, 0, 0, slots, 0, 0.0)
+        _untrack(self._shm)
+        self.slots = slots
+
+    @property
+    def ready(self):
+        return self._shm.buf[4] == 1
+
+    @property
+    def overflowed(self):
+        return self._shm.buf[5] == 1
+
+    @property
+    def count(self):
+        return HEADER.unpack_from(self._shm.buf, 0)[4]
+
+    def mark_ready(self):
+        self._shm.buf[4] = 1
+
+    def heartbeat(self):
+        """Record that the initial load is still making progress."""
+        HEARTBEAT.pack_into(self._shm.buf, HEARTBEAT_OFFSET, time.time())
+
+    def claim_load(self):
+        """Return ``True`` if the caller should load the table: it is not ready and nobody has
+        reported progress on loading it for ``LOAD_TIMEOUT`` seconds (say, the loader died)."""
+        with self._locked():
+            if self.ready:
+                return False
+            if time.time() - HEARTBEAT.unpack_from(self._shm.buf, HEARTBEAT_OFFSET)[0] < LOAD_TIMEOUT:
+                return False
+            self.heartbeat()
+            return True
+
+    def _digest(self, jti):
+        return hashlib.blake2b(jti.encode(), digest_size=16).digest()
+
+    def _offsets(self, digest):
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        for i in range(min(MAX_PROBE, self.slots)):
+            yield HEADER.size + ((start + i) % self.slots) * SLOT.size
+
+    def contains(self, jti):
+        digest = self._digest(jti)
+        buf = self._shm.buf
+        for offset in self._offsets(digest):
+            stored = bytes(buf[offset:offset + 16])
+            if stored == digest:
+                return True
+            if stored == EMPTY:
+                return False
+        return False
+
+    def add(self, jti, exp=None):
+        """Insert ``jti``; returns ``False`` and flags the table as overflowed if no slot is free."""
+        digest = self._digest(jti)
+        now = time.time()
+        with self._locked():
+            buf = self._shm.buf
+            free = None
+            for offset in self._offsets(digest):
+                stored, stored_exp = SLOT.unpack_from(buf, offset)
+                if stored == digest:
+                    return True
+                if stored == EMPTY:
+                    free = free or offset
+                    break
+                if free is None and stored_exp and stored_exp < now:
+                    free = offset
+            if free is None:
+                buf[5] = 1
+                return False
+            was_empty = bytes(buf[free:free + 16]) == EMPTY
+            struct.pack_into('<Q', buf, free + 16, int(exp or 0))
+            buf[free:free + 16] = digest
+            if was_empty:
+                COUNT.pack_into(buf, COUNT_OFFSET, COUNT.unpack_from(buf, COUNT_OFFSET)[0] + 1)
+            return True
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'slots': self.slots,
+            'used': self.count,
+            'load_factor': round(self.count / self.slots, 4),
+            'memory_bytes': self._shm.size,
+            'ready': self.ready,
+            'overflowed': self.overflowed,
+        }
+
+
+def _untrack(shm):
+    # Before Python 3.13 the resource tracker unlinks segments when the process that touched
+    # them exits, which would pull the table out from under the remaining workers.
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
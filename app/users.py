@@ -0,0 +1,134 @@
+import logging
+import sys
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import db
+from .cache import TTLCache
+from .models import User
+from .notify import notify, USERS_CHANNEL
+from .utils import normalize_email
+
+# Detached snapshot of a users row; safe to share between requests and threads
+UserProfile = namedtuple('UserProfile', 'id name email password token_version is_admin')
+
+MISSING = 0  # cached in place of a user id for emails with no account
+PENDING = 'user_cache_pending'  # session.info key: (cache, payload) pairs applied on commit
+
+
+def _sizeof(value):
+    if isinstance(value, UserProfile):
+        return sys.getsizeof(value) + sum(sys.getsizeof(field) for field in value)
+    return sys.getsizeof(value)
+
+
+class UserCache:
+    """Read-through LRU+TTL cache of user profiles, keyed by id and by normalized email.
+
+    ``('id', id)`` maps to a ``UserProfile``; ``('email', email)`` maps to the user's id, or
+    ``MISSING`` for unknown emails. Writers call ``changed`` before committing; with
+    ``broadcast`` the invalidation goes to the other workers over LISTEN/NOTIFY as well.
+    """
+
+    def __init__(self, maxsize, ttl, maxbytes, broadcast=False):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes, sizeof=_sizeof)
+        self.broadcast = broadcast
+
+    def _store(self, user):
+        profile = UserProfile(user.id, user.name, user.email, user.password, user.token_version, user.is_admin)
+        self.cache.set(('id', user.id), profile)
+        # Rows written before emails were normalized may be mixed-case; lookups never are
+        self.cache.set(('email', normalize_email(user.email)), user.id)
+        return profile
+
+    def get_by_id(self, user_id):
+        profile = self.cache.get(('id', int(user_id)))
+        if profile is None:
+            user = db.session.get(User, int(user_id))
+            if user is None:
+                return None
+            profile = self._store(user)
+        return profile
+
+    def get_by_email(self, email):
+        email = normalize_email(email)
+        user_id = self.cache.get(('email', email))
+        if user_id == MISSING:
+            return None
+        if user_id is not None:
+            profile = self.cache.get(('id', user_id))
+            if profile is not None and normalize_email(profile.email) == email:
+                return profile
+        user = User.query.filter(db.func.lower(User.email) == email).first()
+        if user is None:
+            self.cache.set(('email', email), MISSING)
+            return None
+        return self._store(user)
+
+    def invalidate(self, user_id=None, email=None):
+        if user_id is not None:
+            profile = self.cache.pop(('id', int(user_id)))
+            if profile is not None:
+                self.cache.pop(('email', normalize_email(profile.email)))
+        if email is not None:
+            self.cache.pop(('email', normalize_email(email)))
+
+    def changed(self, user_id=None, email=None):
+        """Invalidate a user (by id or email, or everyone when neither is given) in every worker
+        once the current transaction commits; call it before ``db.session.commit()``."""
+        if user_id is not None:
+            payload = f'id:{user_id}'
+        elif email is not None:
+            payload = f'email:{normalize_email(email)}'
+        else:
+            payload = '*'
+        if self.broadcast:
+            notify(USERS_CHANNEL, payload)
+        db.session.info.setdefault(PENDING, []).append((self, payload))
+
+    def apply(self, payload):
+        """Handle an ``id:<id>``, ``email:<email>`` or ``*`` notification."""
+        if payload == '*':
+            self.cache.clear()
+            return
+        kind, _, value = payload.partition(':')
+        if kind == 'id':
+            self.invalidate(user_id=value)
+        elif kind == 'email':
+            self.invalidate(email=value)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for users, payload in session.info.pop(PENDING, ()):
+        users.apply(payload)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING, None)
+
+
+def init_user_cache(app):
+    maxsize = app.config['USER_CACHE_SIZE']
+    if maxsize and not app.config['PG_NOTIFY_ENABLED']:
+        # Sign-in checks the cached password and admin_required the cached is_admin; without
+        # NOTIFY other workers would keep both for up to USER_CACHE_TTL after a change
+        logging.warning("USER_CACHE_SIZE needs PG_NOTIFY_ENABLED; the user cache is disabled")
+        maxsize = 0
+    users = UserCache(
+        maxsize=maxsize,
+        ttl=app.config['USER_CACHE_TTL'],
+        maxbytes=app.config['USER_CACHE_MAX_BYTES'],
+        broadcast=app.config['PG_NOTIFY_ENABLED'],
+    )
+    listener = app.extensions.get('pg_listener')
+    if listener is not None:
+        listener.subscribe(USERS_CHANNEL, users.apply, resync=users.cache.clear)
+    app.extensions['user_cache'] = users
+    return users
@@ -1,19 +1,25 @@
-import smtplib
-import uuid
+import hashlib
+import secrets
 from email.mime.text import MIMEText
 
+def hash_token(value):
+    # Fixed-width 32-byte digest; tokens are stored and looked up by this, never in the clear
+    return hashlib.sha256(value.encode()).digest()
+
+def normalize_email(email):
+    return email.strip().lower()
+
 def generate_reset_token():
-    return str(uuid.uuid4())
+    # 256 bits of entropy; only hash_token(token) is stored
+    return secrets.token_urlsafe(32)
 
-def send_reset_email(email, token):
-    try:
-        msg = MIMEText(f"Click to reset your password: http://localhost:5000/reset-password/{token}")
-        msg['Subject'] = 'Password Reset Request'
-        msg['From'] = 'no-reply@flaskapp.com'
-        msg['To'] = email
+def reset_email(token, reset_url):
+    """Subject and body of the password reset email for ``token``."""
+    return 'Password Reset Request', f"Click to reset your password: {reset_url}{token}"
 
-        print(f"Sending reset email to {email} with token {token}")
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {str(e)}")
-        return False
\ No newline at end of file
+def build_email(sender, recipient, subject, body):
+    msg = MIMEText(body)
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = recipient
+    return msg
@@ -1,28 +1,65 @@
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
-    email VARCHAR(120) UNIQUE NOT NULL,
+    email VARCHAR(120) NOT NULL,
     password VARCHAR(255) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    token_version INTEGER NOT NULL DEFAULT 0,
+    is_admin BOOLEAN NOT NULL DEFAULT FALSE
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email_lower ON users (lower(email));
+
 CREATE TABLE IF NOT EXISTS reset_tokens (
     id SERIAL PRIMARY KEY,
-    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    token VARCHAR(100) NOT NULL UNIQUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER UNIQUE REFERENCES users(id) ON DELETE CASCADE,  -- one live token per user
+    token_hash BYTEA NOT NULL UNIQUE,  -- sha256 of the emailed token
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     expires_at TIMESTAMP NOT NULL
 );
 
-CREATE TABLE IF NOT EXISTS revoked_tokens (
+CREATE INDEX IF NOT EXISTS ix_reset_tokens_expires_at ON reset_tokens (expires_at);
+
+-- Mail written in the same transaction as the row that triggered it; drained by `flask run-email-worker`
+CREATE TABLE IF NOT EXISTS email_outbox (
     id SERIAL PRIMARY KEY,
-    jti VARCHAR(120) NOT NULL UNIQUE,
-    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    recipient VARCHAR(120) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT
 );
 
+CREATE INDEX IF NOT EXISTS ix_email_outbox_next_attempt_at ON email_outbox (next_attempt_at);
+
+-- revoked_tokens and refresh_tokens are range-partitioned by expiry day.
+-- `flask maintain-partitions` creates the daily partitions ahead of time and drops expired ones;
+-- the DEFAULT partition catches anything outside them.
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    id SERIAL,
+    jti VARCHAR(120) NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, expires_at),
+    UNIQUE (jti, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at);
+CREATE TABLE IF NOT EXISTS revoked_tokens_default PARTITION OF revoked_tokens DEFAULT;
+
 CREATE TABLE IF NOT EXISTS refresh_tokens (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    token VARCHAR(1000) NOT NULL UNIQUE,
-    expires_at TIMESTAMP NOT NULL
-);
\ No newline at end of file
+    jti_hash BYTEA NOT NULL,  -- sha256 of the refresh token's jti
+    family_id BYTEA,  -- shared by every rotation of one sign-in
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, expires_at),
+    UNIQUE (jti_hash, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family_id ON refresh_tokens (family_id);
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+
+CREATE TABLE IF NOT EXISTS refresh_tokens_default PARTITION OF refresh_tokens DEFAULT;
\ No newline at end of file
@@ -0,0 +1,105 @@
+-- Brings a database created from the original schema up to the one in init.sql.
+-- Run it once, in a single transaction, with the app stopped:
+--
+--   psql -v ON_ERROR_STOP=1 -1 -f migrations/upgrade.sql
+--
+-- Fresh databases get everything from init.sql and do not need it.
+
+-- users: per-user token versions, admin flag, and emails unique regardless of case.
+-- Normalizing fails on accounts whose emails differ only in case; list them first with
+--   SELECT lower(trim(email)) FROM users GROUP BY 1 HAVING count(*) > 1;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN NOT NULL DEFAULT FALSE;
+UPDATE users SET email = lower(trim(email)) WHERE email <> lower(trim(email));
+ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email_lower ON users (lower(email));
+
+-- reset_tokens: keep a sha256 digest instead of the token (same digest as utils.hash_token,
+-- so links already emailed keep working), and at most one token per user (the newest).
+ALTER TABLE reset_tokens ADD COLUMN token_hash BYTEA;
+UPDATE reset_tokens SET token_hash = sha256(convert_to(token, 'UTF8'));
+ALTER TABLE reset_tokens DROP COLUMN token;
+ALTER TABLE reset_tokens ALTER COLUMN token_hash SET NOT NULL;
+ALTER TABLE reset_tokens ADD CONSTRAINT reset_tokens_token_hash_key UNIQUE (token_hash);
+UPDATE reset_tokens SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE reset_tokens ALTER COLUMN created_at SET NOT NULL;
+DELETE FROM reset_tokens r USING reset_tokens newer
+ WHERE r.user_id = newer.user_id AND (r.created_at, r.id) < (newer.created_at, newer.id);
+ALTER TABLE reset_tokens ADD CONSTRAINT reset_tokens_user_id_key UNIQUE (user_id);
+CREATE INDEX IF NOT EXISTS ix_reset_tokens_expires_at ON reset_tokens (expires_at);
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id SERIAL PRIMARY KEY,
+    recipient VARCHAR(120) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_email_outbox_next_attempt_at ON email_outbox (next_attempt_at);
+
+-- revoked_tokens and refresh_tokens cannot be partitioned in place: copy the live rows aside,
+-- recreate both tables as in init.sql, and copy the rows back.
+
+-- The old rows carry no expiry. An access token lives at most an hour (JWT_ACCESS_TOKEN_EXPIRES),
+-- so revoked_at + 1 hour bounds it; rows past that are dropped. Lookups that fall through to
+-- the database match on the token's exact exp, so rotate JWT_SECRET_KEY or keep the app
+-- stopped for an hour if tokens revoked just before the upgrade must stay rejected.
+CREATE TEMP TABLE revoked_tokens_upgrade ON COMMIT DROP AS
+SELECT jti, revoked_at, revoked_at + interval '1 hour' AS expires_at
+  FROM revoked_tokens
+ WHERE revoked_at + interval '1 hour' > now() AT TIME ZONE 'utc';
+
+-- The old rows hold the whole encoded refresh token; take jti and exp from its payload.
+CREATE TEMP TABLE refresh_tokens_upgrade ON COMMIT DROP AS
+SELECT user_id,
+       sha256(convert_to(payload->>'jti', 'UTF8')) AS jti_hash,
+       to_timestamp((payload->>'exp')::bigint) AT TIME ZONE 'utc' AS expires_at
+  FROM (
+    SELECT user_id, convert_from(decode(
+             translate(part, '-_', '+/') || repeat('=', (4 - length(part) % 4) % 4), 'base64'
+           ), 'UTF8')::json AS payload
+      FROM (SELECT user_id, split_part(token, '.', 2) AS part FROM refresh_tokens) encoded
+  ) decoded
+ WHERE to_timestamp((payload->>'exp')::bigint) > now();
+
+DROP TABLE revoked_tokens;
+DROP TABLE refresh_tokens;
+
+CREATE TABLE revoked_tokens (
+    id SERIAL,
+    jti VARCHAR(120) NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, expires_at),
+    UNIQUE (jti, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+CREATE INDEX ix_revoked_tokens_expires_at ON revoked_tokens (expires_at);
+CREATE TABLE revoked_tokens_default PARTITION OF revoked_tokens DEFAULT;
+
+CREATE TABLE refresh_tokens (
+    id SERIAL,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    jti_hash BYTEA NOT NULL,  -- sha256 of the refresh token's jti
+    family_id BYTEA,  -- shared by every rotation of one sign-in; NULL until first rotated
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, expires_at),
+    UNIQUE (jti_hash, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+CREATE INDEX ix_refresh_tokens_family_id ON refresh_tokens (family_id);
+CREATE INDEX ix_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+CREATE TABLE refresh_tokens_default PARTITION OF refresh_tokens DEFAULT;
+
+INSERT INTO revoked_tokens (jti, revoked_at, expires_at)
+SELECT jti, revoked_at, expires_at FROM revoked_tokens_upgrade;
+
+INSERT INTO refresh_tokens (user_id, jti_hash, expires_at)
+SELECT user_id, jti_hash, expires_at FROM refresh_tokens_upgrade;
+
+-- Then run `flask maintain-partitions` to create the daily partitions; it moves these rows
+-- out of the DEFAULT partitions as it goes.
@@ -54,5 +54,18 @@ class AuthTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('access_token', json.loads(response.data))
 
+    def test_api_emails_match_regardless_of_case(self):
+        response = self.client.post('/api/signup', json=dict(self.user_data, email='Test@Example.com'))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/signin', json={
+            'email': 'test@example.com',
+            'password': self.user_data['password']
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', response.get_json())
+        response = self.client.post('/api/signup', json=dict(self.user_data, email='TEST@example.com'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['message'], 'User already exists')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import unittest
+from app.bloom import CountingBloomFilter
+
+class CountingBloomFilterTestCase(unittest.TestCase):
+    def test_added_items_are_reported(self):
+        bloom = CountingBloomFilter(capacity=1000, fp_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(bloom.might_contain(f'jti-{i}') for i in range(1000)))
+
+    def test_false_positive_rate_near_target(self):
+        bloom = CountingBloomFilter(capacity=1000, fp_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        false_positives = sum(bloom.might_contain(f'other-{i}') for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.03)
+
+    def test_remove(self):
+        bloom = CountingBloomFilter(capacity=100, fp_rate=0.01)
+        bloom.add('jti')
+        self.assertTrue(bloom.remove('jti'))
+        self.assertFalse(bloom.might_contain('jti'))
+        self.assertFalse(bloom.remove('jti'))
+        self.assertEqual(bloom.count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import io
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from app.bulk import UserImporter, parse_rows
+
+
+class UserImporterValidationTestCase(unittest.TestCase):
+    def rows(self, *lines):
+        return list(parse_rows(lines, 'ndjson'))
+
+    def test_bad_rows_are_reported_per_line(self):
+        importer = UserImporter(method='pbkdf2:sha256:1000', workers=1)
+        valid = importer._validate(self.rows(
+            '{"name": "Ok", "email": "OK@example.com", "password": "secret"}',
+            '{"name": "Bad", "email": 42, "password": "secret"}',
+            '{"name": "Bad", "email": "bad@example.com", "password": ["secret"]}',
+            '{"name": "' + 'x' * 101 + '", "email": "long@example.com", "password": "secret"}',
+            '{"name": "Long", "email": "' + 'x' * 120 + '@example.com", "password": "secret"}',
+            'not json',
+        ))
+        self.assertEqual([(line, email) for line, _, email, _ in valid], [(1, 'ok@example.com')])
+        self.assertEqual([e['line'] for e in importer.errors], [2, 3, 4, 5, 6])
+
+    def test_prehashed_rows_need_a_verifiable_hash(self):
+        importer = UserImporter(method='pbkdf2:sha256:1000', prehashed=True, workers=1)
+        valid = importer._validate(self.rows(
+            '{"name": "A", "email": "a@example.com", "password_hash": "pbkdf2:sha256:1000$salt$abc"}',
+            '{"name": "B", "email": "b@example.com", "password_hash": "scrypt:32768:8:1$salt$abc"}',
+            '{"name": "C", "email": "c@example.com", "password_hash": "$2b$12$abcdefghijklmnopqrstuv"}',
+            '{"name": "D", "email": "d@example.com", "password_hash": "md5$salt$abc"}',
+            '{"name": "E", "email": "e@example.com", "password_hash": "pbkdf2:sha256$abc"}',
+        ))
+        self.assertEqual([line for line, *_ in valid], [1, 2])
+        self.assertEqual([e['line'] for e in importer.errors], [3, 4, 5])
+
+    def test_unreadable_csv_record_is_reported_on_its_line(self):
+        lines = ['name,email,password\n', 'A,a@example.com,secret\n', 'B,b@example.com,' + 'x' * 200000 + '\n',
+                 'C,c@example.com,secret\n']
+        parsed = list(parse_rows(lines, 'csv'))
+        self.assertEqual([(line, row is not None) for line, row, _ in parsed], [(2, True), (3, False), (4, True)])
+        self.assertTrue(parsed[1][2].startswith('Invalid CSV'))
+
+    def test_undecodable_bytes_end_the_stream_with_an_error(self):
+        good = b''.join(b'{"name": "User %d"}\n' % i for i in range(1000))
+        lines = io.TextIOWrapper(io.BytesIO(good + b'{"name": "\xff"}\n'), encoding='utf-8', newline='')
+        parsed = list(parse_rows(lines, 'ndjson'))
+        self.assertGreater(len(parsed), 1)
+        self.assertTrue(all(row is not None for _, row, _ in parsed[:-1]))
+        self.assertEqual([line for line, *_ in parsed[:-1]], list(range(1, len(parsed))))
+        self.assertTrue(parsed[-1][2].startswith('Invalid UTF-8'))
+
+    def test_hashing_failure_only_fails_its_row(self):
+        importer = UserImporter(method='no-such-method', workers=1)
+        rows = [(1, 'A', 'a@example.com', 'secret'), (2, 'B', 'b@example.com', 'secret')]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(importer._hash(executor, rows), [])
+        self.assertEqual([e['line'] for e in importer.errors], [1, 2])
+        self.assertTrue(importer.errors[0]['error'].startswith('Hashing failed'))
+
+
+if __name__ == '__main__':
+    unittest.main()
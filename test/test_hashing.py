@@ -0,0 +1,52 @@
+import threading
+import unittest
+from app.hashing import PasswordHasher, HashPoolSaturated, HashTimeout
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def test_hash_and_verify(self):
+        hasher = PasswordHasher(workers=1, queue_limit=1)
+        pwhash = hasher.hash('securepassword')
+        self.assertTrue(hasher.verify(pwhash, 'securepassword'))
+        self.assertFalse(hasher.verify(pwhash, 'wrong'))
+
+    def test_needs_rehash_on_method_change(self):
+        old = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        new = PasswordHasher(method='scrypt:16384:8:1', workers=1)
+        pwhash = old.hash('securepassword')
+        self.assertFalse(old.needs_rehash(pwhash))
+        self.assertTrue(new.needs_rehash(pwhash))
+        self.assertTrue(new.verify(pwhash, 'securepassword'))
+        self.assertFalse(new.needs_rehash(new.hash('securepassword')))
+
+    def test_unknown_hash_format_does_not_verify(self):
+        hasher = PasswordHasher(workers=1, queue_limit=1)
+        self.assertFalse(hasher.verify('$2b$12$abcdefghijklmnopqrstuv', 'securepassword'))
+
+    def test_rejects_when_saturated(self):
+        hasher = PasswordHasher(workers=1, queue_limit=0)
+        release = threading.Event()
+        busy = threading.Thread(target=hasher._run, args=(release.wait,))
+        busy.start()
+        while hasher.in_flight == 0:
+            pass
+        with self.assertRaises(HashPoolSaturated):
+            hasher.hash('securepassword')
+        release.set()
+        busy.join()
+        self.assertEqual(hasher.stats()['rejected'], 1)
+
+    def test_timed_out_job_keeps_its_slot(self):
+        hasher = PasswordHasher(workers=1, queue_limit=0, timeout=0.05)
+        release = threading.Event()
+        with self.assertRaises(HashTimeout):
+            hasher._run(release.wait)
+        self.assertEqual(hasher.in_flight, 1)
+        with self.assertRaises(HashPoolSaturated):
+            hasher.hash('securepassword')
+        release.set()
+        hasher._executor.shutdown(wait=True)
+        self.assertEqual(hasher.in_flight, 0)
+        self.assertEqual(hasher.stats()['completed'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
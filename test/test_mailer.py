@@ -0,0 +1,93 @@
+import socket
+import socketserver
+import threading
+import unittest
+from email.mime.text import MIMEText
+from app.mailer import SmtpPool
+
+
+class SmtpStandIn(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages; each DATA payload is appended to ``server.messages``."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost ready')
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line.decode())
+                self.server.messages.append(''.join(data))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def message(i):
+    msg = MIMEText(f'body {i}')
+    msg['Subject'] = 'Password Reset Request'
+    msg['From'] = 'no-reply@flaskapp.com'
+    msg['To'] = f'user{i}@example.com'
+    return msg
+
+
+class SmtpPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SmtpStandIn)
+        self.server.daemon_threads = True
+        self.server.messages = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = SmtpPool('127.0.0.1', self.server.server_address[1], timeout=5, size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batches_share_one_session(self):
+        self.assertEqual(self.pool.send_batch([message(i) for i in range(50)]), [None] * 50)
+        self.assertEqual(self.pool.send_batch([message(i) for i in range(50, 60)]), [None] * 10)
+        self.assertEqual(len(self.server.messages), 60)
+        self.assertIn('To: user0@example.com', self.server.messages[0])
+        stats = self.pool.stats()
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['sent'], 60)
+        self.assertEqual(stats['batches'], 2)
+        self.assertGreater(stats['messages_per_sec'], 0)
+
+    def test_dropped_idle_session_is_replaced(self):
+        self.pool.noop_after = 0
+        self.pool.send_batch([message(0)])
+        smtp, _ = self.pool._idle[-1]
+        smtp.sock.shutdown(socket.SHUT_RDWR)  # as if the server had timed the session out
+        self.assertEqual(self.pool.send_batch([message(1)]), [None])
+        stats = self.pool.stats()
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['connects'], 2)
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_unreachable_server_fails_every_message(self):
+        pool = SmtpPool('127.0.0.1', free_port(), timeout=1)
+        errors = pool.send_batch([message(0), message(1)])
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(isinstance(e, OSError) for e in errors))
+        self.assertEqual(pool.stats()['failed'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
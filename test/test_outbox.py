@@ -0,0 +1,44 @@
+import socketserver
+import threading
+import unittest
+from types import SimpleNamespace
+from app.mailer import SmtpPool
+from app.outbox import smtp_sender
+from test_mailer import SmtpStandIn
+
+
+class SmtpSenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SmtpStandIn)
+        self.server.messages = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.config = {'MAIL_FROM': 'no-reply@flaskapp.com'}
+        self.pool = SmtpPool('127.0.0.1', self.server.server_address[1], timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def rows(self, count):
+        return [
+            SimpleNamespace(recipient=f'user{i}@example.com', subject='Password Reset Request', body=f'reset link {i}')
+            for i in range(count)
+        ]
+
+    def test_delivers_outbox_rows(self):
+        errors = smtp_sender(self.config, self.pool)(self.rows(3))
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertIn('To: user0@example.com', self.server.messages[0])
+        self.assertIn('reset link 2', self.server.messages[2])
+
+    def test_without_pool_only_logs(self):
+        with self.assertLogs(level='INFO'):
+            errors = smtp_sender(self.config)(self.rows(1))
+        self.assertEqual(errors, [None])
+        self.assertEqual(self.server.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
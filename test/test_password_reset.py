@@ -0,0 +1,66 @@
+import unittest
+from datetime import timedelta
+from app import create_app
+from app.models import db, EmailOutbox, ResetToken
+
+
+class ForgotPasswordTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+        self.client.post('/api/signup', json={
+            'name': 'Test User',
+            'email': 'test@example.com',
+            'password': 'securepassword'
+        })
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def forgot_password(self):
+        response = self.client.post('/api/forgot-password', json={'email': 'test@example.com'})
+        self.assertEqual(response.status_code, 200)
+
+    def rows(self):
+        with self.app.app_context():
+            return ResetToken.query.all(), EmailOutbox.query.order_by(EmailOutbox.id).all()
+
+    def test_repeat_request_inside_window_writes_nothing(self):
+        self.forgot_password()
+        (first,), _ = self.rows()
+        self.forgot_password()
+        tokens, outbox = self.rows()
+        self.assertEqual([t.token_hash for t in tokens], [first.token_hash])
+        self.assertEqual(len(outbox), 1)
+
+    def test_request_after_window_replaces_token(self):
+        self.forgot_password()
+        with self.app.app_context():
+            token = ResetToken.query.one()
+            token.created_at -= timedelta(seconds=self.app.config['RESET_RESEND_WINDOW'] + 1)
+            first_hash = token.token_hash
+            db.session.commit()
+        self.forgot_password()
+        tokens, outbox = self.rows()
+        self.assertEqual(len(tokens), 1)
+        self.assertNotEqual(tokens[0].token_hash, first_hash)
+        self.assertEqual(len(outbox), 2)
+
+    def test_reset_token_works_only_once(self):
+        self.forgot_password()
+        _, (email,) = self.rows()
+        token = email.body.rsplit('/', 1)[-1]
+        first = self.client.post(f'/api/reset-password/{token}', json={'password': 'newpassword'})
+        self.assertEqual(first.status_code, 200)
+        second = self.client.post(f'/api/reset-password/{token}', json={'password': 'otherpassword'})
+        self.assertEqual(second.status_code, 400)
+        signin = self.client.post('/api/signin', json={'email': 'test@example.com', 'password': 'newpassword'})
+        self.assertEqual(signin.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import time
+import unittest
+from app.shm import HEARTBEAT, HEARTBEAT_OFFSET, LOAD_TIMEOUT, SharedRevocationTable
+
+class SharedRevocationTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.name = f'test_revoked_{os.getpid()}'
+        self.table = SharedRevocationTable(self.name, slots=64)
+
+    def tearDown(self):
+        self.table._shm.close()
+        self.table._shm.unlink()
+
+    def test_add_and_contains(self):
+        self.assertTrue(self.table.created)
+        self.assertTrue(self.table.add('jti-1'))
+        self.assertTrue(self.table.contains('jti-1'))
+        self.assertFalse(self.table.contains('jti-2'))
+        self.assertEqual(self.table.count, 1)
+
+    def test_second_handle_sees_writes(self):
+        other = SharedRevocationTable(self.name, slots=64)
+        self.assertFalse(other.created)
+        self.table.add('jti-1')
+        self.assertTrue(other.contains('jti-1'))
+        other._shm.close()
+
+    def test_expired_slots_are_reused(self):
+        for i in range(64):
+            self.table.add(f'old-{i}', exp=time.time() - 1)
+        self.assertTrue(self.table.add('new', exp=time.time() + 60))
+        self.assertTrue(self.table.contains('new'))
+        self.assertFalse(self.table.overflowed)
+
+    def test_segment_with_other_slot_count_is_replaced(self):
+        self.table.add('jti-1')
+        self.table._shm.close()
+        self.table = SharedRevocationTable(self.name, slots=128)
+        self.assertTrue(self.table.created)
+        self.assertEqual(self.table.slots, 128)
+        self.assertFalse(self.table.contains('jti-1'))
+
+    def test_stalled_load_is_taken_over(self):
+        self.assertTrue(self.table.claim_load())
+        other = SharedRevocationTable(self.name, slots=64)
+        self.assertFalse(other.claim_load())
+        HEARTBEAT.pack_into(self.table._shm.buf, HEARTBEAT_OFFSET, time.time() - LOAD_TIMEOUT - 1)
+        self.assertTrue(other.claim_load())
+        other.mark_ready()
+        self.assertFalse(self.table.claim_load())
+        other._shm.close()
+
+    def test_overflow_is_flagged(self):
+        for i in range(64):
+            self.table.add(f'jti-{i}')
+        self.assertFalse(self.table.add('one-too-many'))
+        self.assertTrue(self.table.overflowed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import unittest
+from unittest import mock
+from app import create_app
+
+
+class RefreshTokenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            from app.models import db
+            db.create_all()
+        self.client.post('/api/signup', json={
+            'name': 'Test User',
+            'email': 'test@example.com',
+            'password': 'securepassword'
+        })
+        response = self.client.post('/api/signin', json={
+            'email': 'test@example.com',
+            'password': 'securepassword'
+        })
+        self.tokens = response.get_json()
+
+    def tearDown(self):
+        with self.app.app_context():
+            from app.models import db
+            db.session.remove()
+            db.drop_all()
+
+    def refresh(self, refresh_token):
+        return self.client.post('/api/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+
+    def test_refresh_rotates_refresh_token(self):
+        response = self.refresh(self.tokens['refresh_token'])
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertIn('access_token', body)
+        self.assertNotEqual(body['refresh_token'], self.tokens['refresh_token'])
+        self.assertEqual(self.refresh(body['refresh_token']).status_code, 200)
+
+    def test_rotated_refresh_token_is_rejected_on_reuse(self):
+        self.assertEqual(self.refresh(self.tokens['refresh_token']).status_code, 200)
+        self.assertEqual(self.refresh(self.tokens['refresh_token']).status_code, 401)
+
+    def test_reuse_revokes_the_whole_family(self):
+        successor = self.refresh(self.tokens['refresh_token']).get_json()['refresh_token']
+        self.assertEqual(self.refresh(self.tokens['refresh_token']).status_code, 401)
+        self.assertEqual(self.refresh(successor).status_code, 401)
+
+    def test_logout_with_pre_rotation_access_token_revokes_current_refresh_token(self):
+        successor = self.refresh(self.tokens['refresh_token']).get_json()['refresh_token']
+        response = self.client.post('/api/logout', headers={'Authorization': f"Bearer {self.tokens['access_token']}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(successor).status_code, 401)
+
+
+class LogoutAllTestCase(unittest.TestCase):
+    def setUp(self):
+        env = mock.patch.dict(os.environ, {'TOKEN_VERSION_REVOCATION': 'true'})
+        env.start()
+        self.addCleanup(env.stop)
+        self.app = create_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            from app.models import db
+            db.create_all()
+        self.client.post('/api/signup', json={
+            'name': 'Test User',
+            'email': 'test@example.com',
+            'password': 'securepassword'
+        })
+        self.sessions = [self.signin() for _ in range(2)]
+
+    def tearDown(self):
+        with self.app.app_context():
+            from app.models import db
+            db.session.remove()
+            db.drop_all()
+
+    def signin(self):
+        return self.client.post('/api/signin', json={
+            'email': 'test@example.com',
+            'password': 'securepassword'
+        }).get_json()
+
+    def dashboard(self, access_token):
+        return self.client.get('/api/dashboard', headers={'Authorization': f'Bearer {access_token}'})
+
+    def refresh(self, refresh_token):
+        return self.client.post('/api/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+
+    def logout_all(self, access_token):
+        return self.client.post('/api/logout-all', headers={'Authorization': f'Bearer {access_token}'})
+
+    def test_logout_all_rejects_every_session(self):
+        for tokens in self.sessions:
+            self.assertEqual(self.dashboard(tokens['access_token']).status_code, 200)
+        self.assertEqual(self.logout_all(self.sessions[0]['access_token']).status_code, 200)
+        for tokens in self.sessions:
+            self.assertEqual(self.dashboard(tokens['access_token']).status_code, 401)
+            self.assertEqual(self.refresh(tokens['refresh_token']).status_code, 401)
+
+    def test_signin_after_logout_all_gets_working_tokens(self):
+        self.assertEqual(self.logout_all(self.sessions[1]['access_token']).status_code, 200)
+        tokens = self.signin()
+        self.assertEqual(self.dashboard(tokens['access_token']).status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh_token']).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()